@@ -50,6 +50,7 @@ interface HealthCheck {
 
 interface ReportResult {
     success: boolean;
+    status?: string;
     filename: string;
     path: string;
     download_url: string;
@@ -192,6 +193,10 @@ export class LLMClient {
             );
 
             if (response.success) {
+                // Reports are built in the background - wait until the file exists
+                if (response.status === 'queued') {
+                    await this.waitForReport(response.download_url);
+                }
                 return {
                     success: true,
                     filename: response.filename,
@@ -364,6 +369,35 @@ export class LLMClient {
         throw lastError;
     }
 
+    /**
+     * Poll a queued report until the server has finished writing it
+     */
+    private async waitForReport(downloadUrl: string, timeout: number = 120000): Promise<void> {
+        const deadline = Date.now() + timeout;
+        
+        while (Date.now() < deadline) {
+            // HEAD runs the same wait as a download but skips the PDF body
+            const response = await axios({
+                method: 'HEAD',
+                url: `${this.serverUrl}${downloadUrl}`,
+                timeout: 30000,
+                validateStatus: () => true
+            });
+            
+            if (response.status === 200) {
+                return;
+            }
+            if (response.status !== 202) {
+                throw new Error(`HTTP ${response.status}: report could not be generated`);
+            }
+            
+            const retryAfter = Number(response.headers['retry-after']) || 2;
+            await this.delay(retryAfter * 1000);
+        }
+        
+        throw new Error('Timed out waiting for the report to be generated');
+    }
+
     /**
      * Delay helper for retry logic
      */
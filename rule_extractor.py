@@ -2,48 +2,95 @@
 ╔══════════════════════════════════════════════════════════════════════════════╗
 ║  SCHNEIDER ELECTRIC - RULE EXTRACTOR v2.0                                   ║
 ║  Extract coding rules from PDF, PPT, Word files using AI                   ║
-║  Auto-saves to Extracted_Rules_From_Pdf.json + Push to GitHub               ║
+║  Auto-saves to Extracted_Rules_From_Pdf.json(l) + Push to GitHub            ║
 ╚══════════════════════════════════════════════════════════════════════════════╝
 """
 
 import streamlit as st
-import json
+import functools
+import importlib
+import itertools
+import msgspec
 import os
+import re
+import hashlib
+import shutil
 import subprocess
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
-import google.generativeai as genai
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # ── File parsers ──────────────────────────────────────────────────────────────
-try:
-    import pdfplumber
-    PDF_OK = True
-except ImportError:
-    PDF_OK = False
-
-try:
-    from pptx import Presentation
-    PPTX_OK = True
-except ImportError:
-    PPTX_OK = False
+# PDF libraries are imported on first use: pdfplumber alone drags in pdfminer,
+# PIL and cryptography. DOCX/PPTX are plain zipped XML and need no library.
+@functools.lru_cache(maxsize=None)
+def load_parser(module: str):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        return None
 
-try:
-    from docx import Document
-    DOCX_OK = True
-except ImportError:
-    DOCX_OK = False
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_T = f"{W_NS}p", f"{W_NS}t"
+A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+A_P, A_T = f"{A_NS}p", f"{A_NS}t"
+SLIDE_RE = re.compile(r"ppt/slides/slide(\d+)\.xml")
+
+def xml_paragraphs(fp, p_tag: str, t_tag: str):
+    # Yield non-blank paragraphs from an Office XML part, joining their text runs
+    runs = []
+    for _, el in ET.iterparse(fp):
+        if el.tag == t_tag and el.text:
+            runs.append(el.text)
+        elif el.tag == p_tag:
+            para = "".join(runs)
+            runs.clear()
+            el.clear()
+            if para.strip():
+                yield para
 
 # ── Config ────────────────────────────────────────────────────────────────────
 load_dotenv()
 
 RULES_GUIDE_FOLDER = Path("Rules_Guide_Used")
 RULES_OUTPUT_FILE  = Path("server/Extracted_Rules_From_Pdf.json")
+RULES_LOG_FILE     = Path("server/Extracted_Rules_From_Pdf.jsonl")
 GEMINI_API_KEY     = os.getenv("GEMINI_API_KEY", "")
 GITHUB_REPO_PATH   = Path(".")
+MAX_DOC_CHARS      = 8000   # text budget per document sent to Gemini
+SMALL_DOC_CHARS    = 3000   # documents below this are batched together
+BATCH_CHAR_BUDGET  = 7000   # combined text budget for one batched prompt
+MAX_UPLOAD_MB      = int(os.getenv("MAX_UPLOAD_MB", "50"))
+MAX_WORKERS        = int(os.getenv("EXTRACT_WORKERS", "6"))  # stay under Gemini RPM limits
+
+TEXT_CACHE_DIR     = RULES_GUIDE_FOLDER / ".cache"
+RULE_CACHE_DIR     = Path("server/.rule_cache")
+RULE_CACHE_MAX     = 100    # cached Gemini results kept before LRU trim
+
+EXTS = frozenset({".pdf", ".pptx", ".ppt", ".docx", ".doc", ".txt"})
 
 RULES_GUIDE_FOLDER.mkdir(exist_ok=True)
 
+# ── Rule schema ───────────────────────────────────────────────────────────────
+# Typed rules decode/encode without per-key reflection and validate Gemini output.
+# Defaults are not written out, so rules that never had those keys keep their shape.
+class Rule(msgspec.Struct, omit_defaults=True):
+    rule: str
+    rule_id: str = ""
+    suggested_fix: str = ""
+    source: str = ""
+    category: str = "general"
+    severity: str = "info"
+
+RULE_DECODER  = msgspec.json.Decoder(Rule)
+RULES_DECODER = msgspec.json.Decoder(list[Rule])
+ENCODER       = msgspec.json.Encoder()
+
 # ── Page setup ────────────────────────────────────────────────────────────────
 st.set_page_config(
     page_title="Rule Extractor | Schneider AI",
@@ -66,52 +113,105 @@ st.markdown("""
 def get_gemini():
     if not GEMINI_API_KEY:
         return None
+    import google.generativeai as genai
     genai.configure(api_key=GEMINI_API_KEY)
     return genai.GenerativeModel("gemini-2.0-flash")
 
 # ── Text extractors ───────────────────────────────────────────────────────────
-def extract_text(file_path: str) -> str:
+def extract_text(file_path: str, max_chars: int = 8000) -> str:
     ext = Path(file_path).suffix.lower()
     try:
         if ext == ".pdf":
-            if not PDF_OK:
-                return "ERROR: run pip install pdfplumber"
-            text = []
+            fitz = load_parser("fitz")  # PyMuPDF
+            if fitz:
+                # PyMuPDF extracts in C, skipping pdfminer's layout analysis
+                text, total = [], 0
+                with fitz.open(file_path) as doc:
+                    for page in doc:
+                        t = page.get_text("text")
+                        text.append(t)
+                        total += len(t)
+                        if total >= max_chars:
+                            break
+                return "\n".join(text)
+            pdfplumber = load_parser("pdfplumber")
+            if not pdfplumber:
+                return "ERROR: run pip install pymupdf (or pdfplumber)"
+            text, total = [], 0
             with pdfplumber.open(file_path) as pdf:
                 for page in pdf.pages:
                     t = page.extract_text()
                     if t:
                         text.append(t)
+                        total += len(t)
+                        if total >= max_chars:
+                            break
             return "\n".join(text)
 
         elif ext in (".pptx", ".ppt"):
-            if not PPTX_OK:
-                return "ERROR: run pip install python-pptx"
-            prs = Presentation(file_path)
-            text = []
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        text.append(shape.text.strip())
+            # Read a:t runs from the slide XML directly; notes, masters and
+            # themes live elsewhere in the package and are skipped
+            text, total = [], 0
+            with zipfile.ZipFile(file_path) as z:
+                slides = sorted((n for n in z.namelist() if SLIDE_RE.fullmatch(n)),
+                                key=lambda n: int(SLIDE_RE.fullmatch(n).group(1)))
+                for name in slides:
+                    with z.open(name) as fp:
+                        for para in xml_paragraphs(fp, A_P, A_T):
+                            text.append(para)
+                            total += len(para)
+                            if total >= max_chars:
+                                break
+                    if total >= max_chars:
+                        break
             return "\n".join(text)
 
         elif ext in (".docx", ".doc"):
-            if not DOCX_OK:
-                return "ERROR: run pip install python-docx"
-            doc = Document(file_path)
-            return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
+            # Stream w:t runs straight out of word/document.xml instead of
+            # building python-docx's full object model
+            text, total = [], 0
+            with zipfile.ZipFile(file_path) as z, z.open("word/document.xml") as fp:
+                for para in xml_paragraphs(fp, W_P, W_T):
+                    text.append(para)
+                    total += len(para)
+                    if total >= max_chars:
+                        break
+            return "\n".join(text)
 
         elif ext == ".txt":
-            return open(file_path, encoding="utf-8", errors="ignore").read()
+            with open(file_path, encoding="utf-8", errors="ignore") as fp:
+                return fp.read(max_chars)
 
         else:
             return f"ERROR: Unsupported type {ext}"
     except Exception as e:
         return f"ERROR: {e}"
 
+@st.cache_data(max_entries=128, show_spinner=False)
+def _cached_text(file_path: str, mtime: float, size: int, max_chars: int) -> str:
+    # Parsed text is a pure function of the file bytes, so keep it on disk too
+    digest = hashlib.sha1(Path(file_path).read_bytes()).hexdigest()[:16]
+    cached = TEXT_CACHE_DIR / f"{digest}_{max_chars}.txt"
+    if cached.exists():
+        return cached.read_text(encoding="utf-8")
+    text = extract_text(file_path, max_chars=max_chars)
+    if not text.startswith("ERROR"):
+        TEXT_CACHE_DIR.mkdir(exist_ok=True)
+        cached.write_text(text, encoding="utf-8")
+    return text
+
+def load_text(file_path: str, max_chars: int = MAX_DOC_CHARS) -> str:
+    # A file removed or locked since the folder scan becomes an ERROR result,
+    # like any other unreadable document, instead of aborting the whole run
+    try:
+        info = os.stat(file_path)
+        return _cached_text(file_path, info.st_mtime, info.st_size, max_chars)
+    except OSError as e:
+        return f"ERROR: {e}"
+
 # ── AI extraction ─────────────────────────────────────────────────────────────
-def extract_rules_with_ai(text: str, source_file: str, model) -> list:
-    prompt = f"""
+# Built once; per call only the source name and the document text are spliced in
+PROMPT_HEAD = """
 You are a Schneider Electric coding standards expert.
 
 Read the document below and extract EVERY coding rule, standard, guideline, or best practice.
@@ -120,7 +220,7 @@ For each rule return a JSON object with:
 - "rule_id": "NEW_001" (placeholder, will be renumbered)
 - "rule": clear 1-2 sentence rule statement
 - "suggested_fix": how to comply with the rule
-- "source": "{source_file}"
+- "source": "{{SOURCE}}"
 - "category": one of [naming, structure, security, energy, documentation, safety, performance, general]
 - "severity": one of [critical, error, warning, info]
 
@@ -128,80 +228,286 @@ Return ONLY a valid JSON array. No markdown, no explanation.
 If nothing found, return [].
 
 Document:
-{text[:8000]}
 """
+
+BATCH_PROMPT_HEAD = """
+You are a Schneider Electric coding standards expert.
+
+Read the documents below and extract EVERY coding rule, standard, guideline, or best practice.
+Each document starts with a <<<FILE: name>>> marker.
+
+For each rule return a JSON object with:
+- "rule_id": "NEW_001" (placeholder, will be renumbered)
+- "rule": clear 1-2 sentence rule statement
+- "suggested_fix": how to comply with the rule
+- "source": the file name from the <<<FILE: name>>> marker of the document the rule came from
+- "category": one of [naming, structure, security, energy, documentation, safety, performance, general]
+- "severity": one of [critical, error, warning, info]
+
+Return ONLY a valid JSON array. No markdown, no explanation.
+If nothing found, return [].
+
+Documents:
+"""
+
+# Documents with fewer than RULE_KEYWORDS_MIN hits are skipped without calling Gemini
+RULE_KEYWORDS_RE = re.compile(
+    r"\b(shall|must|should|rule|guideline|require|prohibit|avoid|naming convention|standard)\b",
+    re.I,
+)
+RULE_KEYWORDS_MIN = 3
+
+_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.S)
+
+def looks_like_rules(text: str) -> bool:
+    hits = RULE_KEYWORDS_RE.finditer(text, 0, MAX_DOC_CHARS)
+    return len(list(itertools.islice(hits, RULE_KEYWORDS_MIN))) >= RULE_KEYWORDS_MIN
+
+def extract_rules_with_ai(text: str, source_file: str, model) -> list:
+    prompt = PROMPT_HEAD.replace("{{SOURCE}}", source_file) + text[:MAX_DOC_CHARS]
+    cached = read_rule_cache(prompt)
+    if cached is not None:
+        return cached
+    try:
+        rules = parse_rules(generate_streamed(model, prompt, source_file))
+        write_rule_cache(prompt, rules)
+        return rules
+    except Exception as e:
+        st.error(f"AI error: {e}")
+        return []
+
+def extract_rules_batch(docs: list, model) -> list:
+    # One Gemini call for several small documents, tagged so rules keep their source
+    names = {fname for fname, _ in docs}
+    prompt = BATCH_PROMPT_HEAD + "\n\n".join(f"<<<FILE: {fname}>>>\n{text}" for fname, text in docs)
+    cached = read_rule_cache(prompt)
+    if cached is not None:
+        return cached
     try:
-        response = model.generate_content(prompt)
-        raw = response.text.strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        rules = json.loads(raw.strip())
-        return rules if isinstance(rules, list) else []
+        rules = parse_rules(generate_streamed(model, prompt, ", ".join(sorted(names))))
+        rules = [r for r in rules if r.source in names]
+        write_rule_cache(prompt, rules)
+        return rules
     except Exception as e:
         st.error(f"AI error: {e}")
         return []
 
+def _rule_cache_path(prompt: str) -> Path:
+    return RULE_CACHE_DIR / f"{hashlib.sha1(prompt.encode()).hexdigest()}.json"
+
+def read_rule_cache(prompt: str):
+    # Same prompt (source name + document text) → same rules, so skip the API call
+    path = _rule_cache_path(prompt)
+    if not path.exists():
+        return None
+    try:
+        os.utime(path)  # mark as recently used for the LRU trim
+        return RULES_DECODER.decode(path.read_bytes())
+    except (OSError, msgspec.DecodeError):
+        return None
+
+def write_rule_cache(prompt: str, rules: list):
+    RULE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    _rule_cache_path(prompt).write_bytes(ENCODER.encode(rules))
+    entries = sorted(RULE_CACHE_DIR.glob("*.json"), key=lambda f: f.stat().st_mtime)
+    for stale in entries[:-RULE_CACHE_MAX]:
+        stale.unlink(missing_ok=True)
+
+def generate_streamed(model, prompt: str, label: str) -> str:
+    # Stream the response so the UI shows progress while Gemini is still generating
+    status = st.empty()
+    buf, total = [], 0
+    for chunk in model.generate_content(prompt, stream=True):
+        buf.append(chunk.text)
+        total += len(chunk.text)
+        status.caption(f"⏳ {label}: {total} chars received")
+    status.empty()
+    return "".join(buf)
+
+def parse_rules(raw: str) -> list:
+    # Typed decode: a malformed Gemini reply fails here, not later in the UI
+    return RULES_DECODER.decode(_JSON_FENCE_RE.sub("", raw))
+
+def plan_batches(docs: list) -> list:
+    # Large documents go alone; small ones share a prompt up to the char budget
+    batches, current, used = [], [], 0
+    for fname, text in docs:
+        if len(text) >= SMALL_DOC_CHARS:
+            batches.append([(fname, text)])
+            continue
+        if current and used + len(text) > BATCH_CHAR_BUDGET:
+            batches.append(current)
+            current, used = [], 0
+        current.append((fname, text))
+        used += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+def run_batch(batch: list, model) -> list:
+    if len(batch) == 1:
+        fname, text = batch[0]
+        return extract_rules_with_ai(text, fname, model)
+    return extract_rules_batch(batch, model)
+
 # ── Rules JSON helpers ────────────────────────────────────────────────────────
 def load_existing_rules() -> list:
-    if RULES_OUTPUT_FILE.exists():
-        try:
-            return json.loads(RULES_OUTPUT_FILE.read_text(encoding="utf-8")).get("rules", [])
-        except Exception:
-            return []
-    return []
-
-def save_rules(rules: list):
-    RULES_OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    RULES_OUTPUT_FILE.write_text(
-        json.dumps({"rules": rules}, indent=2, ensure_ascii=False),
-        encoding="utf-8"
+    # Errors propagate: an empty list here would let save/export truncate the rules
+    rules, meta = [], {}
+    migrate_rules_json()
+    if RULES_LOG_FILE.exists():
+        with RULES_LOG_FILE.open("rb") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                if line.startswith(b'{"meta"'):
+                    meta = msgspec.json.decode(line)["meta"]
+                else:
+                    rules.append(RULE_DECODER.decode(line))
+    st.session_state["rules_meta"] = meta
+    if "existing_rule_hashes" not in st.session_state:
+        st.session_state["existing_rule_hashes"] = {rule_hash(r) for r in rules}
+    return rules
+
+def save_rules(new_rules: list):
+    # Append-only JSON Lines: a save costs O(new rules) however large the log grows.
+    # A trailing {"meta": ...} record carries max_rule_num for the next numbering.
+    if st.session_state.get("rules_load_error"):
+        raise RuntimeError(f"{RULES_LOG_FILE.name} could not be loaded; not saving")
+    meta = st.session_state.get("rules_meta", {})
+    meta["max_rule_num"] = max(meta.get("max_rule_num", 0), scan_max_rule_num(new_rules))
+    RULES_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with RULES_LOG_FILE.open("ab") as fp:
+        for r in new_rules:
+            fp.write(ENCODER.encode(r) + b"\n")
+        fp.write(ENCODER.encode({"meta": meta}) + b"\n")
+    st.session_state["rules_meta"] = meta
+    # The server loads the JSON form, so a local save has to reach it too
+    export_rules_json()
+    # Extend the duplicate-check hashes in place rather than rehashing the whole log
+    st.session_state.setdefault("existing_rule_hashes", set()).update(rule_hash(r) for r in new_rules)
+
+def migrate_rules_json():
+    # Converts the {"rules": [...]} file into the JSONL log when there is no log yet,
+    # or when the JSON changed outside this app (e.g. a git pull): every export stamps
+    # the log with the JSON's mtime, so only an outside write leaves the JSON newer.
+    # Records are validated against Rule but written as they were, extra keys included.
+    if not RULES_OUTPUT_FILE.exists():
+        return
+    if RULES_LOG_FILE.exists() and RULES_LOG_FILE.stat().st_mtime_ns >= RULES_OUTPUT_FILE.stat().st_mtime_ns:
+        return
+    data = msgspec.json.decode(RULES_OUTPUT_FILE.read_bytes())
+    raw_rules = data.get("rules", [])
+    rules = msgspec.convert(raw_rules, list[Rule])
+    meta = data.get("meta") or {"max_rule_num": scan_max_rule_num(rules)}
+    tmp = RULES_LOG_FILE.with_name(RULES_LOG_FILE.name + ".tmp")
+    with tmp.open("wb") as fp:
+        for r in raw_rules:
+            fp.write(ENCODER.encode(r) + b"\n")
+        fp.write(ENCODER.encode({"meta": meta}) + b"\n")
+    os.replace(tmp, RULES_LOG_FILE)
+
+def export_rules_json():
+    # The review server reads the JSON array form; rebuild it only when publishing.
+    # Log records are copied through untouched so keys outside Rule survive.
+    migrate_rules_json()
+    raw_rules, meta = [], {}
+    if RULES_LOG_FILE.exists():
+        with RULES_LOG_FILE.open("rb") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                record = msgspec.json.decode(line)
+                if line.startswith(b'{"meta"'):
+                    meta = record["meta"]
+                else:
+                    msgspec.convert(record, Rule)
+                    raw_rules.append(record)
+    RULES_OUTPUT_FILE.write_bytes(
+        msgspec.json.format(ENCODER.encode({"rules": raw_rules, "meta": meta}), indent=2)
     )
+    if RULES_LOG_FILE.exists():
+        exported_ns = RULES_OUTPUT_FILE.stat().st_mtime_ns
+        os.utime(RULES_LOG_FILE, ns=(exported_ns, exported_ns))
+
+def rule_hash(rule: Rule) -> bytes:
+    # Short fixed-size digest so duplicate checks never re-lowercase stored rules
+    return hashlib.blake2b(rule.rule.lower().encode(), digest_size=8).digest()
+
+def scan_max_rule_num(rules: list) -> int:
+    nums = ["".join(filter(str.isdigit, r.rule_id)) for r in rules]
+    return max((int(n) for n in nums if n), default=0)
 
 def get_next_rule_number(existing: list) -> int:
-    nums = ["".join(filter(str.isdigit, r.get("rule_id", ""))) for r in existing]
-    nums = [int(n) for n in nums if n]
-    return max(nums, default=0) + 1
+    meta = st.session_state.get("rules_meta", {})
+    if "max_rule_num" not in meta:
+        # Logs without a meta record yet: scan once, saved on next write
+        meta["max_rule_num"] = scan_max_rule_num(existing)
+        st.session_state["rules_meta"] = meta
+    return meta["max_rule_num"] + 1
 
 def renumber(rules: list, start: int) -> list:
     for i, r in enumerate(rules):
-        r["rule_id"] = f"R{start + i:03d}"
+        r.rule_id = f"R{start + i:03d}"
     return rules
 
 # ── Git helpers ───────────────────────────────────────────────────────────────
+# No optional index locks: avoids contending with background git on large repos
+GIT_ENV = {**os.environ, "GIT_OPTIONAL_LOCKS": "0"}
+
 def run_git(cmd: list) -> tuple:
     try:
-        r = subprocess.run(cmd, cwd=str(GITHUB_REPO_PATH.resolve()),
+        r = subprocess.run(cmd, cwd=str(GITHUB_REPO_PATH.resolve()), env=GIT_ENV,
                            capture_output=True, text=True, timeout=30)
         return r.returncode == 0, r.stdout + r.stderr
     except Exception as e:
         return False, str(e)
 
+def start_push() -> subprocess.Popen:
+    # Runs in the background so the page isn't blocked on the network round-trip
+    return subprocess.Popen(["git", "push", "--no-progress", "origin", "main"],
+                            cwd=str(GITHUB_REPO_PATH.resolve()), env=GIT_ENV,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
 def push_to_github(commit_msg: str) -> tuple:
     steps = []
 
-    ok, out = run_git(["git", "add", str(RULES_OUTPUT_FILE)])
+    try:
+        export_rules_json()
+    except Exception as e:
+        steps.append(("export rules", False, str(e)))
+        return False, steps, None
+    ok, out = run_git(["git", "add", str(RULES_OUTPUT_FILE), str(RULES_LOG_FILE)])
     steps.append(("git add", ok, out))
     if not ok:
-        return False, steps
+        return False, steps, None
 
-    ok, out = run_git(["git", "commit", "-m", commit_msg])
+    # Commit only the rules files, never whatever else happens to be staged
+    ok, out = run_git(["git", "-c", "gc.auto=0", "commit", "-m", commit_msg, "--",
+                       str(RULES_OUTPUT_FILE), str(RULES_LOG_FILE)])
     steps.append(("git commit", ok, out))
     if not ok:
-        if "nothing to commit" in out:
+        if "nothing to commit" in out or "nothing added to commit" in out:
             steps.append(("note", True, "Already up to date — no changes to commit."))
-            return True, steps
-        return False, steps
+            return True, steps, None
+        return False, steps, None
 
-    ok, out = run_git(["git", "push", "origin", "main"])
-    steps.append(("git push", ok, out))
-    return ok, steps
+    try:
+        return True, steps, start_push()
+    except Exception as e:
+        steps.append(("git push", False, str(e)))
+        return False, steps, None
+
+@st.cache_data(show_spinner=False)
+def _scan_folder_cached(mtime: float) -> list:
+    # Keyed on the folder mtime, which changes whenever a file is added or removed.
+    # One scandir pass yields name, path and size without a second stat per file.
+    with os.scandir(RULES_GUIDE_FOLDER) as it:
+        return sorted((e.name, e.path, e.stat().st_size) for e in it
+                      if e.is_file() and os.path.splitext(e.name)[1].lower() in EXTS)
 
 def scan_folder() -> list:
-    exts = {".pdf", ".pptx", ".ppt", ".docx", ".doc", ".txt"}
-    return sorted([f for f in RULES_GUIDE_FOLDER.iterdir()
-                   if f.is_file() and f.suffix.lower() in exts])
+    return _scan_folder_cached(RULES_GUIDE_FOLDER.stat().st_mtime)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # UI
@@ -214,12 +520,19 @@ model = get_gemini()
 if not model:
     st.error("⚠️ GEMINI_API_KEY missing from .env")
 
-existing_rules = load_existing_rules()
+try:
+    existing_rules = load_existing_rules()
+    st.session_state["rules_load_error"] = None
+except Exception as e:
+    existing_rules = []
+    st.session_state["rules_load_error"] = str(e)
+    st.error(f"❌ Could not load {RULES_LOG_FILE.name}: {e} — saving and pushing are disabled until it is fixed")
+files = scan_folder()
 
 # Stats bar
 c1, c2, c3, c4 = st.columns(4)
 c1.metric("📋 Rules in JSON", len(existing_rules))
-c2.metric("📁 Files in Folder", len(scan_folder()))
+c2.metric("📁 Files in Folder", len(files))
 c3.metric("🆕 This Session", len(st.session_state.get("extracted_rules", [])))
 c4.metric("🤖 Model", "Gemini 2.0 Flash")
 st.divider()
@@ -237,39 +550,51 @@ with col1:
     )
     if uploaded:
         for f in uploaded:
+            if f.size > MAX_UPLOAD_MB * 1024 * 1024:
+                st.error(f"❌ {f.name} is {f.size // (1024 * 1024)} MB — limit is {MAX_UPLOAD_MB} MB")
+                continue
             dest = RULES_GUIDE_FOLDER / f.name
-            dest.write_bytes(f.read())
+            try:
+                with open(dest, "wb") as out:
+                    shutil.copyfileobj(f, out, length=1024 * 1024)
+            except OSError as e:
+                dest.unlink(missing_ok=True)
+                st.error(f"❌ Could not save {f.name}: {e}")
+                continue
             st.success(f"✅ Saved: **{f.name}**")
+        # Overwriting a file keeps the folder mtime, so drop cached sizes explicitly
+        _scan_folder_cached.clear()
+        files = scan_folder()
 
     st.divider()
     st.subheader("📂 Rules_Guide_Used")
-    files = scan_folder()
     if not files:
         st.info("No files yet. Upload above or paste files into the folder.")
     else:
-        for fp in files:
-            ext = fp.suffix.upper().lstrip(".")
+        cards = []
+        for name, _, size in files:
+            ext = os.path.splitext(name)[1].upper().lstrip(".")
             icon = {"PDF":"📄","PPTX":"📊","PPT":"📊","DOCX":"📝","DOC":"📝","TXT":"📃"}.get(ext,"📄")
-            kb = max(1, fp.stat().st_size // 1024)
-            st.markdown(
-                f'<div class="file-card">{icon} <b>{fp.name}</b> '
-                f'<span style="color:#888;float:right">{kb} KB</span></div>',
-                unsafe_allow_html=True
+            kb = max(1, size // 1024)
+            cards.append(
+                f'<div class="file-card">{icon} <b>{name}</b> '
+                f'<span style="color:#888;float:right">{kb} KB</span></div>'
             )
+        # One markdown element instead of one per file keeps reruns cheap
+        st.markdown("".join(cards), unsafe_allow_html=True)
 
 # ── RIGHT: Extract ────────────────────────────────────────────────────────────
 with col2:
     st.subheader("🤖 Extract with AI")
-    files = scan_folder()
 
     if not files:
         st.info("Upload files on the left first.")
     else:
-        file_names = [f.name for f in files]
+        file_names = [name for name, _, _ in files]
         selected = st.multiselect("Select files:", options=file_names, default=file_names)
 
         ca, cb = st.columns(2)
-        auto_save  = ca.toggle("Auto-save to JSON", value=True)
+        auto_save  = ca.toggle("Auto-save to JSON + log", value=True)
         skip_dupes = cb.toggle("Skip duplicates",   value=True)
 
         if st.button("🚀 Extract Rules Now", use_container_width=True):
@@ -281,33 +606,62 @@ with col2:
                 all_new = []
                 prog = st.progress(0, text="Starting...")
 
-                for idx, fname in enumerate(selected):
-                    prog.progress(idx / len(selected), text=f"📖 {fname}")
-                    with st.spinner(f"Reading {fname}..."):
-                        text = extract_text(str(RULES_GUIDE_FOLDER / fname))
+                # Gemini latency dominates, so overlap calls on a small pool;
+                # workers inherit the script context so st.* calls still render
+                ctx = get_script_run_ctx()
+                results = {}
+                with ThreadPoolExecutor(
+                    max_workers=min(MAX_WORKERS, len(selected)),
+                    initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+                ) as ex:
+                    texts = ex.map(lambda f: load_text(str(RULES_GUIDE_FOLDER / f)), selected)
+                    docs, skipped = [], set()
+                    for fname, text in zip(selected, texts):
                         if text.startswith("ERROR"):
-                            st.warning(f"⚠️ {text}")
-                            continue
-                        rules = extract_rules_with_ai(text, fname, model)
-                        if rules:
-                            all_new.extend(rules)
-                            st.success(f"✅ **{fname}** → {len(rules)} rules")
+                            results[fname] = (text, [])
+                        elif not looks_like_rules(text):
+                            results[fname] = (None, [])
+                            skipped.add(fname)
                         else:
-                            st.warning(f"⚠️ No rules found in {fname}")
+                            docs.append((fname, text))
+
+                    batches = plan_batches(docs)
+                    futures = {ex.submit(run_batch, batch, model): batch for batch in batches}
+                    for done, fut in enumerate(as_completed(futures), 1):
+                        batch = futures[fut]
+                        rules = fut.result()
+                        prog.progress(done / len(batches),
+                                      text=f"📖 {', '.join(fname for fname, _ in batch)}")
+                        for fname, _ in batch:
+                            results[fname] = (None, [r for r in rules if len(batch) == 1
+                                                     or r.source == fname])
+
+                # Report and collect in selection order so numbering stays stable
+                for fname in selected:
+                    error, rules = results[fname]
+                    if error:
+                        st.warning(f"⚠️ {error}")
+                    elif fname in skipped:
+                        st.info(f"⏭️ Skipped **{fname}** — no rule-like wording found")
+                    elif rules:
+                        all_new.extend(rules)
+                        st.success(f"✅ **{fname}** → {len(rules)} rules")
+                    else:
+                        st.warning(f"⚠️ No rules found in {fname}")
 
                 prog.progress(1.0, text="✅ Done!")
 
                 if all_new:
                     all_new = renumber(all_new, get_next_rule_number(existing_rules))
                     if skip_dupes:
-                        exist_set = {r.get("rule","").lower() for r in existing_rules}
-                        all_new = [r for r in all_new if r.get("rule","").lower() not in exist_set]
+                        hashes = st.session_state.get("existing_rule_hashes", set())
+                        all_new = [r for r in all_new if rule_hash(r) not in hashes]
 
                     st.session_state["extracted_rules"] = all_new
                     st.info(f"📋 **{len(all_new)} unique new rules** ready")
 
-                    if auto_save:
-                        save_rules(existing_rules + all_new)
+                    if auto_save and not st.session_state["rules_load_error"]:
+                        save_rules(all_new)
                         st.session_state["rules_saved"] = True
                         st.success(f"💾 Saved! Total: **{len(existing_rules)+len(all_new)}** rules")
                         st.balloons()
@@ -315,6 +669,40 @@ with col2:
                     st.error("No rules extracted.")
 
 # ── GITHUB PUSH ───────────────────────────────────────────────────────────────
+def render_push_status():
+    proc = st.session_state["push_proc"]
+    if proc is not None and proc.poll() is not None:
+        st.session_state["push_steps"].append(("git push", proc.returncode == 0, proc.stdout.read()))
+        st.session_state["push_ok"] = proc.returncode == 0
+        st.session_state["push_proc"] = None
+        st.rerun()
+
+    for name, ok, out in st.session_state["push_steps"]:
+        icon = "✅" if ok else "❌"
+        with st.expander(f"{icon} {name}", expanded=not ok):
+            st.code(out or "No output")
+
+    success = st.session_state["push_ok"]
+    if success is None:
+        st.info("⬆️ Pushing to GitHub...")
+    elif success:
+        st.success("🎉 **Pushed to GitHub successfully!**")
+        st.markdown(
+            "🔗 [View on GitHub](https://github.com/ShriHarsan64K/Schneider-AI-Code-Reviewer"
+            "/blob/main/server/Extracted_Rules_From_Pdf.json)"
+        )
+    else:
+        st.error("❌ Push failed — check details above.")
+        st.info("""
+**Quick fixes:**
+- Run `git config --global user.email "you@email.com"` in terminal
+- Make sure you're inside the repo folder when running streamlit
+- Check internet connection
+""")
+
+# Re-run just the status block every second while the background push is running
+poll_push_status = st.fragment(run_every=1)(render_push_status)
+
 st.divider()
 st.subheader("🐙 Push to GitHub")
 
@@ -330,55 +718,48 @@ else:
     commit_msg = col_msg.text_input("Commit message:", value=default_msg,
                                     label_visibility="collapsed")
 
-    if col_btn.button("⬆️ Push to GitHub", use_container_width=True):
+    if st.session_state["rules_load_error"]:
+        col_btn.button("⬆️ Push to GitHub", use_container_width=True, disabled=True)
+    elif col_btn.button("⬆️ Push to GitHub", use_container_width=True):
         if not st.session_state.get("rules_saved"):
-            save_rules(existing_rules + extracted)
-
-        with st.spinner("Pushing..."):
-            success, steps = push_to_github(commit_msg)
+            save_rules(extracted)
 
-        for name, ok, out in steps:
-            icon = "✅" if ok else "❌"
-            with st.expander(f"{icon} {name}", expanded=not ok):
-                st.code(out or "No output")
+        with st.spinner("Committing..."):
+            success, steps, proc = push_to_github(commit_msg)
+        st.session_state["push_steps"] = steps
+        st.session_state["push_proc"] = proc
+        st.session_state["push_ok"] = None if proc else success
 
-        if success:
-            st.success("🎉 **Pushed to GitHub successfully!**")
-            st.markdown(
-                "🔗 [View on GitHub](https://github.com/ShriHarsan64K/Schneider-AI-Code-Reviewer"
-                "/blob/main/server/Extracted_Rules_From_Pdf.json)"
-            )
+    if "push_steps" in st.session_state:
+        if st.session_state["push_proc"] is not None:
+            poll_push_status()
         else:
-            st.error("❌ Push failed — check details above.")
-            st.info("""
-**Quick fixes:**
-- Run `git config --global user.email "you@email.com"` in terminal
-- Make sure you're inside the repo folder when running streamlit
-- Check internet connection
-""")
+            render_push_status()
 
 # ── PREVIEW ───────────────────────────────────────────────────────────────────
 st.divider()
 st.subheader("👀 Preview Extracted Rules")
 
 if extracted:
-    cats = ["All"] + sorted({r.get("category","general") for r in extracted})
+    cats = ["All"] + sorted({r.category for r in extracted})
     sel_cat = st.selectbox("Filter by category:", cats)
-    filtered = extracted if sel_cat == "All" else [r for r in extracted if r.get("category") == sel_cat]
+    filtered = extracted if sel_cat == "All" else [r for r in extracted if r.category == sel_cat]
 
     st.markdown(f"Showing **{len(filtered)}** rules:")
+    cards = []
     for rule in filtered[:50]:
-        sev = rule.get("severity","info")
+        sev = rule.severity
         col = {"critical":"#ff4444","error":"#ff8800","warning":"#ffcc00","info":"#3DCD58"}.get(sev,"#888")
-        st.markdown(f"""
+        cards.append(f"""
 <div class="rule-card">
     <div style="display:flex;justify-content:space-between;margin-bottom:4px">
-        <b style="color:#3DCD58">{rule.get('rule_id','')}</b>
+        <b style="color:#3DCD58">{rule.rule_id}</b>
         <span style="color:{col};font-size:12px;text-transform:uppercase">{sev}</span>
     </div>
-    <div style="color:#e0e0e0;margin-bottom:6px">{rule.get('rule','')}</div>
-    <div style="color:#888;font-size:13px">🔧 {rule.get('suggested_fix','')}</div>
-    <div style="color:#555;font-size:11px;margin-top:4px">📁 {rule.get('source','')} · 🏷️ {rule.get('category','')}</div>
-</div>""", unsafe_allow_html=True)
+    <div style="color:#e0e0e0;margin-bottom:6px">{rule.rule}</div>
+    <div style="color:#888;font-size:13px">🔧 {rule.suggested_fix}</div>
+    <div style="color:#555;font-size:11px;margin-top:4px">📁 {rule.source} · 🏷️ {rule.category}</div>
+</div>""")
+    st.markdown("".join(cards), unsafe_allow_html=True)
 else:
     st.info("Run an extraction above to see rules here.")
@@ -8,20 +8,27 @@
 ╚══════════════════════════════════════════════════════════════════════════════╝
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, send_file, stream_with_context
 from flask_cors import CORS
 import json
+import orjson
 import re
 import os
-from datetime import datetime
-from typing import Dict, List, Tuple
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER
+import hashlib
+import io
+import multiprocessing
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path, PureWindowsPath
+from typing import Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
+from report_pdf import build_pdf, clear_report_markers, render_pdf_bytes
 import logging
 
 # Configure logging FIRST - before any imports that use logger
@@ -67,6 +74,24 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# Behind nginx/Apache with X-Sendfile enabled, let the web server stream report
+# files instead of copying them through Python. Off by default: without such a
+# proxy the downloads would be empty.
+app.use_x_sendfile = os.getenv('USE_X_SENDFILE', '0') == '1'
+
+
+def read_json():
+    """Parse the request body with orjson; None if it is empty or not JSON"""
+    try:
+        return orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        return None
+
+
+def ojsonify(obj) -> Response:
+    """jsonify() replacement that serializes with orjson"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 # Configuration
 LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini').lower()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
@@ -118,6 +143,7 @@ if LLM_PROVIDER == 'gemini' and GEMINI_API_KEY and GEMINI_AVAILABLE:
 # Load Schneider Electric Rules
 RULES_PATH = 'Extracted_Rules_From_Pdf.json'
 ALL_RULES = []
+_RULES_BY_ID: Dict[str, Dict] = {}
 RULE_CATEGORIES = {
     'naming': [],
     'structure': [],
@@ -126,26 +152,36 @@ RULE_CATEGORIES = {
     'general': []
 }
 
+# Keyword alternations per category, checked in priority order
+_CAT_PATTERNS = {
+    'naming': re.compile(r'name|identifier|prefix|hungarian'),
+    'structure': re.compile(r'structure|format|indent|declaration'),
+    'security': re.compile(r'security|at |address|access'),
+    'energy': re.compile(r'energy|optimiz|performance|efficiency'),
+}
+
 try:
-    with open(RULES_PATH, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # Parsed at import so a preloading server (gunicorn preload_app) shares it across forked workers
+    with open(RULES_PATH, 'rb') as f:
+        data = orjson.loads(f.read())
         ALL_RULES = data.get('rules', [])
         
-        # Categorize rules for better organization
+        # Categorize rules for better organization (first matching category wins)
         for rule in ALL_RULES:
             rule_text = rule.get('rule', '').lower()
             
-            if any(kw in rule_text for kw in ['name', 'identifier', 'prefix', 'hungarian']):
-                RULE_CATEGORIES['naming'].append(rule)
-            elif any(kw in rule_text for kw in ['structure', 'format', 'indent', 'declaration']):
-                RULE_CATEGORIES['structure'].append(rule)
-            elif any(kw in rule_text for kw in ['security', 'at ', 'address', 'access']):
-                RULE_CATEGORIES['security'].append(rule)
-            elif any(kw in rule_text for kw in ['energy', 'optimiz', 'performance', 'efficiency']):
-                RULE_CATEGORIES['energy'].append(rule)
+            for category, pattern in _CAT_PATTERNS.items():
+                if pattern.search(rule_text):
+                    RULE_CATEGORIES[category].append(rule)
+                    break
             else:
                 RULE_CATEGORIES['general'].append(rule)
         
+        # Index by ID for fix_code's rule lookups (first rule wins on duplicates)
+        for rule in ALL_RULES:
+            if rule.get('rule_id'):
+                _RULES_BY_ID.setdefault(rule['rule_id'], rule)
+        
         logger.info(f"✅ Loaded {len(ALL_RULES)} Schneider rules")
         logger.info(f"   📋 Naming: {len(RULE_CATEGORIES['naming'])}")
         logger.info(f"   📋 Structure: {len(RULE_CATEGORIES['structure'])}")
@@ -160,6 +196,7 @@ except Exception as e:
 
 REPORTS_DIR = 'reports'
 os.makedirs(REPORTS_DIR, exist_ok=True)
+_REPORTS_ROOT = Path(REPORTS_DIR).resolve()
 
 
 def format_rules_for_prompt(rules: List[Dict], max_rules: int = 40) -> str:
@@ -167,7 +204,7 @@ def format_rules_for_prompt(rules: List[Dict], max_rules: int = 40) -> str:
     if not rules:
         return "No specific rules loaded."
     
-    rule_text = "SCHNEIDER ELECTRIC MANDATORY CODING STANDARDS:\n\n"
+    parts: List[str] = ["SCHNEIDER ELECTRIC MANDATORY CODING STANDARDS:\n\n"]
     
     # Prioritize by category
     priority_order = ['security', 'naming', 'structure', 'energy', 'general']
@@ -178,12 +215,12 @@ def format_rules_for_prompt(rules: List[Dict], max_rules: int = 40) -> str:
         if not cat_rules:
             continue
             
-        rule_text += f"--- {category.upper()} RULES ---\n"
+        parts.append(f"--- {category.upper()} RULES ---\n")
         
         for rule in cat_rules[:min(10, max_rules - rules_added)]:
             rules_added += 1
-            rule_text += f"[{rule.get('rule_id', 'N/A')}] {rule.get('rule', '')}\n"
-            rule_text += f"  Fix: {rule.get('suggested_fix', 'N/A')}\n\n"
+            parts.append(f"[{rule.get('rule_id', 'N/A')}] {rule.get('rule', '')}\n")
+            parts.append(f"  Fix: {rule.get('suggested_fix', 'N/A')}\n\n")
             
             if rules_added >= max_rules:
                 break
@@ -191,66 +228,204 @@ def format_rules_for_prompt(rules: List[Dict], max_rules: int = 40) -> str:
         if rules_added >= max_rules:
             break
     
-    rule_text += f"\n(Showing {rules_added} of {len(rules)} total rules)\n"
-    return rule_text
+    parts.append(f"\n(Showing {rules_added} of {len(rules)} total rules)\n")
+    return "".join(parts)
+
+
+# Rules block for the /analyze system prompt - rendered once at startup
+PROMPT_MAX_RULES = 40
+_PROMPT_RULES_TEXT = format_rules_for_prompt(ALL_RULES, max_rules=PROMPT_MAX_RULES)
 
+# Stable head of every /analyze system prompt. It must stay first and verbatim:
+# OpenAI caches repeated prompt prefixes automatically, and Gemini can hold it
+# as CachedContent (see _gemini_cached_model).
+ANALYSIS_SYSTEM_PREFIX = f"""You are a STRICT professional code reviewer for Schneider Electric.
+
+{_PROMPT_RULES_TEXT}
+
+"""
 
-def calculate_score(issues: List[Dict]) -> Tuple[int, str]:
+
+# Grade boundaries: a score at or above _GRADE_THRESHOLDS[i] earns _GRADES[i + 1]
+_GRADE_THRESHOLDS = [50, 60, 65, 70, 75, 80, 85, 90, 95]
+_GRADES = ['F', 'D', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+']
+
+
+def calculate_score(counts: Dict[str, int]) -> Tuple[int, str]:
     """
     Calculate code quality score with FAIR, BALANCED penalties
     
+    Args:
+        counts: Issue counts keyed by severity (e.g. a Counter)
+    
     Returns:
         Tuple[int, str]: (score, grade_letter)
     """
-    if not issues:
+    if not counts:
         return 100, 'A+'
     
-    # Count by severity
-    critical_count = sum(1 for i in issues if i.get('severity') == 'critical')
-    error_count = sum(1 for i in issues if i.get('severity') == 'error')
-    warning_count = sum(1 for i in issues if i.get('severity') == 'warning')
-    info_count = sum(1 for i in issues if i.get('severity') == 'info')
-    
     # Fair penalty system
     deductions = (
-        critical_count * 12 +  # Critical: -12 points
-        error_count * 6 +      # Error: -6 points
-        warning_count * 3 +    # Warning: -3 points
-        info_count * 1         # Info: -1 point
+        counts.get('critical', 0) * 12 +  # Critical: -12 points
+        counts.get('error', 0) * 6 +      # Error: -6 points
+        counts.get('warning', 0) * 3 +    # Warning: -3 points
+        counts.get('info', 0) * 1         # Info: -1 point
     )
     
     score = max(0, min(100, 100 - deductions))
     
     # Ensure minimum score if code has no critical issues
-    if score < 10 and critical_count == 0:
+    if score < 10 and counts.get('critical', 0) == 0:
         score = 10
     
     # Determine grade
-    if score >= 95:
-        grade = 'A+'
-    elif score >= 90:
-        grade = 'A'
-    elif score >= 85:
-        grade = 'A-'
-    elif score >= 80:
-        grade = 'B+'
-    elif score >= 75:
-        grade = 'B'
-    elif score >= 70:
-        grade = 'B-'
-    elif score >= 65:
-        grade = 'C+'
-    elif score >= 60:
-        grade = 'C'
-    elif score >= 50:
-        grade = 'D'
-    else:
-        grade = 'F'
+    grade = _GRADES[bisect_right(_GRADE_THRESHOLDS, score)]
     
     return score, grade
 
 
+# In-process LRU of LLM responses. temperature=0.1 makes replies effectively
+# deterministic, so resubmitting the same code skips the network round-trip.
+LLM_CACHE_SIZE = 512
+_LLM_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_LLM_CACHE_LOCK = threading.Lock()
+_LLM_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+
+def _llm_cache_key(prompt: str, system_role: str) -> str:
+    """Key a response by provider, model and the full prompt text"""
+    model = OPENAI_MODEL if LLM_PROVIDER == 'openai' else GEMINI_MODEL
+    return hashlib.sha256(f"{LLM_PROVIDER}|{model}|{system_role}|{prompt}".encode()).hexdigest()
+
+
+def _llm_cache_get(key: str, record_miss: bool = True) -> Optional[str]:
+    """Look up a cached response and record the hit/miss"""
+    with _LLM_CACHE_LOCK:
+        if key in _LLM_CACHE:
+            _LLM_CACHE.move_to_end(key)
+            _LLM_CACHE_STATS['hits'] += 1
+            return _LLM_CACHE[key]
+        if record_miss:
+            _LLM_CACHE_STATS['misses'] += 1
+    return None
+
+
+def _llm_cache_put(key: str, response: str) -> None:
+    """Store a response, evicting the least recently used entry"""
+    # Never cache failures - the next request should retry the provider
+    if response and not response.startswith(('Error:', 'ERROR:')):
+        with _LLM_CACHE_LOCK:
+            _LLM_CACHE[key] = response
+            if len(_LLM_CACHE) > LLM_CACHE_SIZE:
+                _LLM_CACHE.popitem(last=False)
+
+
 def get_llm_response(prompt: str, system_role: str) -> str:
+    """Get AI response, served from the response cache when possible"""
+    key = _llm_cache_key(prompt, system_role)
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        return cached
+    
+    response = _call_llm(prompt, system_role)
+    _llm_cache_put(key, response)
+    return response
+
+
+def stream_llm_response(prompt: str, system_role: str) -> Iterator[str]:
+    """Yield the AI response in chunks as the provider generates it"""
+    key = _llm_cache_key(prompt, system_role)
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts: List[str] = []
+    try:
+        if LLM_PROVIDER == 'openai' and openai_client:
+            stream = openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system_role},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,
+                max_tokens=4000,
+                stream=True
+            )
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    parts.append(text)
+                    yield text
+        
+        elif LLM_PROVIDER == 'gemini' and genai_module:
+            model = genai_module.GenerativeModel(
+                model_name=GEMINI_MODEL,
+                generation_config={
+                    'temperature': 0.1,
+                    'max_output_tokens': 4000,
+                }
+            )
+            for chunk in model.generate_content(f"{system_role}\n\n{prompt}", stream=True):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Safety-blocked or finish-only chunks have no parts; .text raises on them
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+        
+        else:
+            yield "ERROR: No AI provider available"
+            return
+    
+    except Exception as e:
+        logger.error(f"❌ AI Error: {e}")
+        yield f"Error: {str(e)}"
+        return
+    
+    _llm_cache_put(key, "".join(parts))
+
+
+# Gemini explicit context caching for ANALYSIS_SYSTEM_PREFIX. Opt-in, since the
+# prefix must reach the model's minimum cacheable size; if creating the cache
+# fails once, plain calls are used for the rest of the process.
+GEMINI_PROMPT_CACHE = os.getenv('GEMINI_PROMPT_CACHE', '0') == '1'
+GEMINI_CACHE_TTL = 3600
+_GEMINI_CACHE = {'model': None, 'expires': 0.0, 'disabled': not GEMINI_PROMPT_CACHE}
+_GEMINI_CACHE_LOCK = threading.Lock()
+
+
+def _gemini_cached_model(generation_config: Dict):
+    """Return a Gemini model bound to the cached rules prefix, or None"""
+    with _GEMINI_CACHE_LOCK:
+        if _GEMINI_CACHE['disabled'] or not genai_module:
+            return None
+        now = time.time()
+        if _GEMINI_CACHE['model'] is None or now >= _GEMINI_CACHE['expires']:
+            try:
+                cache = genai_module.caching.CachedContent.create(
+                    model=f"models/{GEMINI_MODEL}",
+                    system_instruction=ANALYSIS_SYSTEM_PREFIX,
+                    ttl=timedelta(seconds=GEMINI_CACHE_TTL),
+                )
+                _GEMINI_CACHE['model'] = genai_module.GenerativeModel.from_cached_content(
+                    cached_content=cache,
+                    generation_config=generation_config
+                )
+                # Refresh a minute early so requests never hit an expired cache
+                _GEMINI_CACHE['expires'] = now + GEMINI_CACHE_TTL - 60
+                logger.info("✅ Gemini rules prefix cached")
+            except Exception as e:
+                logger.warning(f"⚠️  Gemini prompt cache unavailable, using plain calls: {e}")
+                _GEMINI_CACHE['disabled'] = True
+                return None
+        return _GEMINI_CACHE['model']
+
+
+def _call_llm(prompt: str, system_role: str) -> str:
     """Get AI response with proper error handling"""
     try:
         if LLM_PROVIDER == 'openai' and openai_client:
@@ -267,12 +442,18 @@ def get_llm_response(prompt: str, system_role: str) -> str:
             return content if content else ""
         
         elif LLM_PROVIDER == 'gemini' and genai_module:
+            generation_config = {
+                'temperature': 0.1,
+                'max_output_tokens': 4000,
+            }
+            if system_role.startswith(ANALYSIS_SYSTEM_PREFIX):
+                cached_model = _gemini_cached_model(generation_config)
+                if cached_model:
+                    suffix = system_role[len(ANALYSIS_SYSTEM_PREFIX):]
+                    return cached_model.generate_content(f"{suffix}\n\n{prompt}").text
             model = genai_module.GenerativeModel(
                 model_name=GEMINI_MODEL,
-                generation_config={
-                    'temperature': 0.1,
-                    'max_output_tokens': 4000,
-                }
+                generation_config=generation_config
             )
             full_prompt = f"{system_role}\n\n{prompt}"
             response = model.generate_content(full_prompt)
@@ -286,65 +467,85 @@ def get_llm_response(prompt: str, system_role: str) -> str:
         return f"Error: {str(e)}"
 
 
+# Language aliases for matching fenced code blocks
+_LANG_ALIASES: Dict[str, List[str]] = {
+    'py': ['python', 'py'],
+    'js': ['javascript', 'js'],
+    'ts': ['typescript', 'ts'],
+    'java': ['java'],
+    'c': ['c'],
+    'cpp': ['cpp', 'c++', 'cxx'],
+    'st': ['st', 'structured-text', 'iecst'],
+}
+_ALL_LANG_TOKENS = frozenset(a for al in _LANG_ALIASES.values() for a in al)
+
+# Compiled once - extract_clean_code runs on every /fix response
+_GENERIC_FENCE = re.compile(r'```\n?(.*?)\n?```', re.DOTALL)
+_TRAILING_FENCE = re.compile(r'```\w*')
+# Chatty lead-in lines ("Here is the fixed code:") dropped from fence-less replies
+_SKIP_PHRASES_TUPLE: Tuple[str, ...] = ('here is', "here's", 'certainly', 'sure,', 'of course',
+                                       "i've", 'below is', 'the following', 'as requested', 'the fixed')
+_FENCE_TEMPLATES = (r'```{}\n(.*?)\n```', r'```{}\r\n(.*?)\r\n```', r'```{}(.*?)```')
+
+
+def _compile_fence_patterns(aliases: List[str]) -> List[re.Pattern]:
+    """Language-specific fence patterns for the given language tags"""
+    return [re.compile(template.format(re.escape(alias)), re.DOTALL | re.IGNORECASE)
+            for alias in aliases for template in _FENCE_TEMPLATES]
+
+
+# Precompiled for the known languages only, so client input never grows it
+_FENCE_PATTERNS: Dict[str, List[re.Pattern]] = {
+    ext: _compile_fence_patterns(aliases) for ext, aliases in _LANG_ALIASES.items()
+}
+
+
+def _fence_patterns(file_ext: str) -> List[re.Pattern]:
+    """Fence patterns for file_ext - any other extension is compiled per call"""
+    patterns = _FENCE_PATTERNS.get(file_ext)
+    if patterns is None:
+        patterns = _compile_fence_patterns([file_ext])
+    return patterns
+
+
 def extract_clean_code(ai_response: str, file_ext: str = 'py') -> str:
     """Extract only code from AI response - handles all languages"""
     
-    # Language aliases for matching
-    lang_aliases = {
-        'py': ['python', 'py'],
-        'js': ['javascript', 'js'],
-        'ts': ['typescript', 'ts'],
-        'java': ['java'],
-        'c': ['c'],
-        'cpp': ['cpp', 'c++', 'cxx'],
-        'st': ['st', 'structured-text', 'iecst'],
-    }
-    
-    aliases = lang_aliases.get(file_ext, [file_ext])
-    
     # Try specific language patterns first
-    for alias in aliases:
-        patterns = [
-            rf'```{re.escape(alias)}\n(.*?)\n```',
-            rf'```{re.escape(alias)}\r\n(.*?)\r\n```',
-            rf'```{re.escape(alias)}(.*?)```',
-        ]
-        for pattern in patterns:
-            matches = re.findall(pattern, ai_response, re.DOTALL | re.IGNORECASE)
-            if matches:
-                return matches[0].strip()
+    for pattern in _fence_patterns(file_ext):
+        match = pattern.search(ai_response)
+        if match:
+            return match.group(1).strip()
     
     # Try generic code block
-    generic = re.findall(r'```\n?(.*?)\n?```', ai_response, re.DOTALL)
+    generic = _GENERIC_FENCE.search(ai_response)
     if generic:
-        code = generic[0].strip()
+        code = generic.group(1).strip()
         # Remove language tag if it's the first line
-        lines = code.split('\n')
-        if lines and lines[0].strip().lower() in [a for al in lang_aliases.values() for a in al]:
-            code = '\n'.join(lines[1:]).strip()
+        first_line, _, rest = code.partition('\n')
+        if first_line.strip().lower() in _ALL_LANG_TOKENS:
+            code = rest.strip()
         return code
     
     # No code blocks - return cleaned response
-    skip_phrases = ('here is', "here's", 'certainly', 'sure,', 'of course',
-                    "i've", 'below is', 'the following', 'as requested', 'the fixed')
     lines = []
     for line in ai_response.split('\n'):
-        stripped = line.lower().strip()
+        stripped = line.strip().lower()
         # Skip language-only lines like "cpp" or "java" at start
-        if stripped in [a for al in lang_aliases.values() for a in al]:
+        if stripped in _ALL_LANG_TOKENS:
             continue
-        if not any(stripped.startswith(p) for p in skip_phrases):
+        if not stripped.startswith(_SKIP_PHRASES_TUPLE):
             lines.append(line)
     
     result = '\n'.join(lines).strip()
-    result = re.sub(r'```\w*', '', result).replace('```', '').strip()
+    result = _TRAILING_FENCE.sub('', result).replace('```', '').strip()
     return result
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Enhanced health check"""
-    return jsonify({
+    return ojsonify({
         'status': 'healthy',
         'version': '8.0',
         'llm_provider': LLM_PROVIDER,
@@ -352,6 +553,7 @@ def health_check():
         'rules_loaded': len(ALL_RULES),
         'rules_by_category': {k: len(v) for k, v in RULE_CATEGORIES.items()},
         'rag_enabled': True,
+        'llm_cache': {**_LLM_CACHE_STATS, 'size': len(_LLM_CACHE)},
         'features': [
             'schneider_rules_integration',
             'fair_scoring',
@@ -363,46 +565,308 @@ def health_check():
     }), 200
 
 
+def count_lines(code: str) -> int:
+    """Count lines without splitting - a trailing newline doesn't start a new line"""
+    return code.count('\n') + (0 if code.endswith('\n') else 1)
+
+
+def build_analysis_prompt(code: str, file_ext: str) -> str:
+    """Build the user prompt for analyzing a piece of code"""
+    return f"""Analyze this {file_ext.upper()} code with MAXIMUM STRICTNESS:
+
+```{file_ext}
+{code}
+```
+
+Check for ALL of these in {file_ext.upper()} code:
+1. Missing comments/docstrings on functions and classes
+2. Spacing problems (no spaces around operators, after commas)  
+3. Indentation issues
+4. Naming convention violations
+5. Security issues (hardcoded passwords, secrets, API keys)
+6. Missing type annotations/hints
+7. Any other {file_ext.upper()} best practice violations
+
+Return ONLY a JSON array (absolutely no other text):
+[{{"rule": "DOC-001", "message": "Missing docstring on function calculateEnergy", "line": 1, "severity": "error", "fix": "Add function documentation", "category": "documentation"}}]
+
+BE EXTREMELY STRICT - this code should score LOW before fixing!"""
+
+
+def normalize_issues(issues) -> List[Dict]:
+    """Keep well-formed issues and fill in any missing fields"""
+    # Validate - must be a list
+    if not isinstance(issues, list):
+        return []
+        
+    # Ensure each issue has required fields
+    valid_issues = []
+    for issue in issues:
+        if isinstance(issue, dict) and issue.get('message'):
+            valid_issues.append({
+                'rule': issue.get('rule', 'QUALITY'),
+                'message': issue.get('message', ''),
+                'line': issue.get('line', 1),
+                'severity': issue.get('severity', 'warning'),
+                'fix': issue.get('fix', ''),
+                'category': issue.get('category', 'general')
+            })
+    return valid_issues
+
+
+# Tokens that matter when scanning for the end of a JSON value; an escape
+# sequence is one token so an escaped quote never toggles string state
+_JSON_STRUCT_RE = re.compile(r'\\.|[\[\]{}"]', re.DOTALL)
+
+
+def _extract_top_level_json(text: str, opener: str) -> Optional[str]:
+    """Return the first balanced JSON array/object starting at `opener`, or None.
+    
+    A single left-to-right pass that tracks bracket depth and string state,
+    so prose or brackets inside strings can't make it backtrack.
+    """
+    start = text.find(opener)
+    if start == -1:
+        return None
+    depth = 0
+    in_str = False
+    for match in _JSON_STRUCT_RE.finditer(text, start):
+        ch = match.group()
+        if ch == '"':
+            in_str = not in_str
+        elif in_str or len(ch) > 1:
+            continue
+        elif ch in '[{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return text[start:match.end()]
+    return None
+
+
+def parse_issues(ai_response: str) -> List[Dict]:
+    """Parse the AI's JSON issue array - robust extraction"""
+    issues = []
+    try:
+        # First try: direct JSON parse
+        stripped = ai_response.strip()
+        if stripped.startswith('[') and stripped.endswith(']'):
+            issues = json.loads(stripped)
+        else:
+            # Second try: slice the first balanced JSON array out of the response
+            candidate = _extract_top_level_json(ai_response, '[')
+            if candidate:
+                issues = json.loads(candidate)
+        
+        return normalize_issues(issues)
+        
+    except Exception as e:
+        logger.error(f"JSON parse error: {e}")
+        logger.error(f"AI response was: {ai_response[:200]}")
+        return []
+
+
+# Files longer than this are split at top-level definitions and the sections
+# are reviewed concurrently, so latency is max(section) instead of sum.
+SHARD_MIN_LINES = 500
+SHARD_TARGET_LINES = 250
+# Top-level def/class/function, including JS `export` forms
+_TOP_LEVEL_DEF = re.compile(r'^(?:export (?:default )?)?(?:async def |def |(?:async )?function\b|class )')
+_LLM_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_WORKERS', '8')))
+
+
+def shard_code(code: str) -> List[Tuple[int, str]]:
+    """Split code into (start_line, text) sections at top-level definitions"""
+    lines = code.split('\n')
+    shards = []
+    start = 0
+    decorated_from = None
+    for i, line in enumerate(lines):
+        if line.startswith('@'):
+            # Decorators (possibly spanning lines) stay with the definition below them
+            if decorated_from is None:
+                decorated_from = i
+        elif _TOP_LEVEL_DEF.match(line):
+            cut = i if decorated_from is None else decorated_from
+            decorated_from = None
+            if cut - start >= SHARD_TARGET_LINES:
+                shards.append((start + 1, '\n'.join(lines[start:cut])))
+                start = cut
+    shards.append((start + 1, '\n'.join(lines[start:])))
+    return shards
+
+
+def merge_shard_issues(shard_issues) -> List[Dict]:
+    """Map per-section line numbers back to the file and drop duplicates"""
+    merged = []
+    seen = set()
+    for start, issues in shard_issues:
+        for issue in issues:
+            if isinstance(issue['line'], int):
+                issue['line'] += start - 1
+            key = (issue['rule'], issue['line'], issue['message'])
+            if key not in seen:
+                seen.add(key)
+                merged.append(issue)
+    return merged
+
+
+# Concurrent /analyze calls for small files (IDE save bursts) wait up to
+# ANALYZE_BATCH_WINDOW_MS for company and share one multi-file LLM request,
+# amortizing the system prompt across files. 0 (the default) disables batching.
+ANALYZE_BATCH_WINDOW_MS = int(os.getenv('ANALYZE_BATCH_WINDOW_MS', '0'))
+ANALYZE_BATCH_MAX = 8
+ANALYZE_BATCH_MAX_LINES = 150
+
+
+def build_batch_prompt(files: List[Tuple[str, str]], file_ext: str) -> str:
+    """Build one prompt that analyzes several files, keyed by slot number"""
+    parts = [f"Analyze each of these {file_ext.upper()} files with MAXIMUM STRICTNESS.\n\nFiles:\n"]
+    for slot, (filename, code) in enumerate(files, 1):
+        parts.append(f"{slot}. {filename}\n```{file_ext}\n{code}\n```\n")
+    parts.append(f"""
+Check every file for missing comments/docstrings, spacing, indentation, naming,
+security issues, missing type hints and any other {file_ext.upper()} best practice violations.
+Line numbers are relative to each file.
+
+Return ONLY a JSON object mapping each file number to its issue array (absolutely no other text):
+{{"1": [{{"rule": "DOC-001", "message": "Missing docstring on function calculateEnergy", "line": 1, "severity": "error", "fix": "Add function documentation", "category": "documentation"}}], "2": []}}""")
+    return "".join(parts)
+
+
+def parse_batch_issues(ai_response: str, count: int) -> List:
+    """Parse a slot-keyed batch reply; slots that are missing come back as None"""
+    try:
+        candidate = _extract_top_level_json(ai_response, '{')
+        data = json.loads(candidate) if candidate else {}
+    except Exception as e:
+        logger.error(f"Batch JSON parse error: {e}")
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    return [
+        normalize_issues(data[str(slot)]) if isinstance(data.get(str(slot)), list) else None
+        for slot in range(1, count + 1)
+    ]
+
+
+class AnalyzeBatcher:
+    """Collects concurrent analyze requests that share a system prompt.
+    
+    The first request in a batch waits out the window and then runs it; a
+    request that fills the batch runs it immediately. When no batch is being
+    analyzed the first request runs straight away, since nobody is likely to
+    join it. Everyone else just waits on their own Future.
+    """
+
+    def __init__(self, window_ms: int, max_items: int):
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self._pending: Dict[str, List] = {}
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, system_role: str, file_ext: str, filename: str, code: str) -> List[Dict]:
+        """Queue one file for analysis and block until its issues are ready"""
+        future: Future = Future()
+        with self._lock:
+            batch = self._pending.setdefault(system_role, [])
+            batch.append((filename, code, future))
+            is_leader = len(batch) == 1
+            run_now = len(batch) >= self.max_items or (is_leader and self._running == 0)
+            if run_now:
+                del self._pending[system_role]
+                self._running += 1
+        
+        if run_now:
+            self._run(system_role, file_ext, batch)
+        elif is_leader:
+            time.sleep(self.window)
+            with self._lock:
+                # A later request may already have taken the batch when it filled up
+                if self._pending.get(system_role) is batch:
+                    del self._pending[system_role]
+                    self._running += 1
+                else:
+                    batch = None
+            if batch:
+                self._run(system_role, file_ext, batch)
+        return future.result()
+
+    def _run(self, system_role: str, file_ext: str, batch: List) -> None:
+        """Analyze a batch and resolve every waiting Future"""
+        try:
+            if len(batch) == 1:
+                filename, code, future = batch[0]
+                future.set_result(parse_issues(get_llm_response(build_analysis_prompt(code, file_ext), system_role)))
+                return
+            
+            logger.info(f"Batch analyzing {len(batch)} files")
+            files = [(filename, code) for filename, code, _ in batch]
+            reply = get_llm_response(build_batch_prompt(files, file_ext), system_role)
+            results = parse_batch_issues(reply, len(batch))
+            
+            # Any file the batch reply missed gets its own call
+            retry = [i for i, issues in enumerate(results) if issues is None]
+            if retry:
+                logger.warning(f"⚠️  Batch reply missed {len(retry)} file(s), analyzing individually")
+                replies = _LLM_POOL.map(
+                    lambda i: get_llm_response(build_analysis_prompt(batch[i][1], file_ext), system_role),
+                    retry
+                )
+                for i, single in zip(retry, replies):
+                    results[i] = parse_issues(single)
+            
+            for (_, _, future), issues in zip(batch, results):
+                future.set_result(issues)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+
+_ANALYZE_BATCHER = AnalyzeBatcher(ANALYZE_BATCH_WINDOW_MS, ANALYZE_BATCH_MAX)
+
+
+# Language specific analysis rules, keyed by file extension
+_LANG_ANALYSIS_RULES: Dict[str, str] = {
+    'py': "PEP8 compliance, type hints, docstrings, snake_case naming, no hardcoded secrets",
+    'js': "ESLint rules, const/let usage, JSDoc comments, camelCase naming, semicolons, no hardcoded secrets",
+    'ts': "TypeScript types on all params/returns, TSDoc, camelCase, access modifiers, no var, no hardcoded secrets",
+    'java': "Javadoc on all methods/classes, generics, proper access modifiers, PascalCase classes, camelCase methods, no hardcoded secrets",
+    'c': "Function header comments, const usage, indentation, snake_case, no hardcoded secrets",
+    'cpp': "Doxygen comments, no 'using namespace std', const references, PascalCase classes, no hardcoded secrets",
+    'st': "IEC 61131-3 compliance, variable prefixes (b/i/s/r), indentation inside blocks, comments with (* *), no hardcoded strings",
+    'cs': "XML doc comments, access modifiers, PascalCase, proper namespaces, no hardcoded secrets"
+}
+
+
 @app.route('/analyze', methods=['POST'])
 def analyze_code():
     """
     Analyze code with Schneider Electric rules FULLY INTEGRATED
     """
     try:
-        data = request.json
+        data = read_json()
         if not data:
-            return jsonify({'error': 'No data provided'}), 400
+            return ojsonify({'error': 'No data provided'}), 400
             
         code = data.get('code', '')
         filename = data.get('filename', 'unknown.py')
         
         if not code:
-            return jsonify({'error': 'No code provided'}), 400
+            return ojsonify({'error': 'No code provided'}), 400
         
         file_ext = filename.split('.')[-1].lower()
         
-        # Format Schneider rules for prompt
-        schneider_rules = format_rules_for_prompt(ALL_RULES, max_rules=40)
-        
-        # Language specific analysis rules
-        lang_analysis_rules = {
-            'py': "PEP8 compliance, type hints, docstrings, snake_case naming, no hardcoded secrets",
-            'js': "ESLint rules, const/let usage, JSDoc comments, camelCase naming, semicolons, no hardcoded secrets",
-            'ts': "TypeScript types on all params/returns, TSDoc, camelCase, access modifiers, no var, no hardcoded secrets",
-            'java': "Javadoc on all methods/classes, generics, proper access modifiers, PascalCase classes, camelCase methods, no hardcoded secrets",
-            'c': "Function header comments, const usage, indentation, snake_case, no hardcoded secrets",
-            'cpp': "Doxygen comments, no 'using namespace std', const references, PascalCase classes, no hardcoded secrets",
-            'st': "IEC 61131-3 compliance, variable prefixes (b/i/s/r), indentation inside blocks, comments with (* *), no hardcoded strings",
-            'cs': "XML doc comments, access modifiers, PascalCase, proper namespaces, no hardcoded secrets"
-        }
-        lang_rules = lang_analysis_rules.get(file_ext, "Language best practices, comments, naming conventions, security")
-
-        # ENHANCED SYSTEM PROMPT with rules integration
-        system_role = f"""You are a STRICT professional code reviewer for Schneider Electric.
-
-{schneider_rules}
+        lang_rules = _LANG_ANALYSIS_RULES.get(file_ext, "Language best practices, comments, naming conventions, security")
 
-CRITICAL ANALYSIS INSTRUCTIONS:
+        # ENHANCED SYSTEM PROMPT - cacheable rules prefix + per-language instructions
+        system_role = ANALYSIS_SYSTEM_PREFIX + f"""CRITICAL ANALYSIS INSTRUCTIONS:
 1. This is {file_ext.upper()} code - apply {file_ext.upper()}-specific standards
 2. Check: {lang_rules}
 3. Find EVERY violation - be thorough and strict
@@ -416,74 +880,41 @@ Return ONLY a JSON array. No explanation. No markdown.
 Format: [{{"rule": "RULE-ID", "message": "description", "line": 1, "severity": "error", "fix": "how to fix", "category": "naming"}}]
 If truly no issues: []"""
 
-        prompt = f"""Analyze this {file_ext.upper()} code with MAXIMUM STRICTNESS:
-
-```{file_ext}
-{code}
-```
-
-Check for ALL of these in {file_ext.upper()} code:
-1. Missing comments/docstrings on functions and classes
-2. Spacing problems (no spaces around operators, after commas)  
-3. Indentation issues
-4. Naming convention violations
-5. Security issues (hardcoded passwords, secrets, API keys)
-6. Missing type annotations/hints
-7. Any other {file_ext.upper()} best practice violations
-
-Return ONLY a JSON array (absolutely no other text):
-[{{"rule": "DOC-001", "message": "Missing docstring on function calculateEnergy", "line": 1, "severity": "error", "fix": "Add function documentation", "category": "documentation"}}]
-
-BE EXTREMELY STRICT - this code should score LOW before fixing!"""
-
-        # Get AI analysis
-        logger.info(f"Analyzing {filename} ({len(code)} chars)")
-        ai_response = get_llm_response(prompt, system_role)
-        
-        # Parse JSON - robust extraction
-        issues = []
-        try:
-            # First try: direct JSON parse
-            stripped = ai_response.strip()
-            if stripped.startswith('['):
-                issues = json.loads(stripped)
+        line_count = count_lines(code)
+        logger.info(f"Analyzing {filename} ({len(code)} chars, {line_count} lines)")
+        if line_count > SHARD_MIN_LINES:
+            # Large file - review top-level sections concurrently, then merge
+            shards = shard_code(code)
+            logger.info(f"Sharded {filename} into {len(shards)} sections")
+            replies = _LLM_POOL.map(
+                lambda shard: get_llm_response(build_analysis_prompt(shard[1], file_ext), system_role),
+                shards
+            )
+            issues = merge_shard_issues(
+                (start, parse_issues(reply)) for (start, _), reply in zip(shards, replies)
+            )
+        elif ANALYZE_BATCH_WINDOW_MS > 0 and line_count <= ANALYZE_BATCH_MAX_LINES:
+            # A repeat of a cached file is answered without joining a batch
+            cached = _llm_cache_get(_llm_cache_key(build_analysis_prompt(code, file_ext), system_role),
+                                    record_miss=False)
+            if cached is not None:
+                issues = parse_issues(cached)
             else:
-                # Second try: find JSON array in response
-                json_match = re.search(r'\[[\s\S]*?\](?=\s*$)', ai_response)
-                if not json_match:
-                    json_match = re.search(r'\[[\s\S]*\]', ai_response)
-                if json_match:
-                    issues = json.loads(json_match.group(0))
-            
-            # Validate - must be a list
-            if not isinstance(issues, list):
-                issues = []
-                
-            # Ensure each issue has required fields
-            valid_issues = []
-            for issue in issues:
-                if isinstance(issue, dict) and issue.get('message'):
-                    valid_issues.append({
-                        'rule': issue.get('rule', 'QUALITY'),
-                        'message': issue.get('message', ''),
-                        'line': issue.get('line', 1),
-                        'severity': issue.get('severity', 'warning'),
-                        'fix': issue.get('fix', ''),
-                        'category': issue.get('category', 'general')
-                    })
-            issues = valid_issues
-            
-        except Exception as e:
-            logger.error(f"JSON parse error: {e}")
-            logger.error(f"AI response was: {ai_response[:200]}")
-            issues = []
+                issues = _ANALYZE_BATCHER.submit(system_role, file_ext, filename, code)
+        else:
+            ai_response = get_llm_response(build_analysis_prompt(code, file_ext), system_role)
+            issues = parse_issues(ai_response)
+        
+        # Count severities once - shared by scoring and the statistics block.
+        # str() keeps a list/dict severity from the model from being unhashable
+        counts = Counter(str(i['severity']) for i in issues)
         
         # Calculate FAIR score
-        score, grade = calculate_score(issues)
+        score, grade = calculate_score(counts)
         
         logger.info(f"Analysis complete: {len(issues)} issues, Score: {score}/100 ({grade})")
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'issues': issues,
             'score': score,
@@ -491,22 +922,21 @@ BE EXTREMELY STRICT - this code should score LOW before fixing!"""
             'file_type': file_ext,
             'rules_checked': len(ALL_RULES),
             'statistics': {
-                'critical': sum(1 for i in issues if i.get('severity') == 'critical'),
-                'errors': sum(1 for i in issues if i.get('severity') == 'error'),
-                'warnings': sum(1 for i in issues if i.get('severity') == 'warning'),
-                'info': sum(1 for i in issues if i.get('severity') == 'info')
+                'critical': counts['critical'],
+                'errors': counts['error'],
+                'warnings': counts['warning'],
+                'info': counts['info']
             }
         }), 200
     
     except Exception as e:
         logger.error(f"Analysis error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
 
-def get_language_fix_rules(file_ext: str) -> str:
-    """Return language-specific fix rules for perfect score"""
-    rules = {
-        'py': """- Add module docstring at top: \"\"\"Module description.\"\"\"
+# Language-specific fix rules for a perfect score, keyed by file extension
+_LANG_FIX_RULES: Dict[str, str] = {
+    'py': """- Add module docstring at top: \"\"\"Module description.\"\"\"
 - Add type hints: def func(x: float, y: float) -> float:
 - Add docstrings to every function, class, __init__
 - 4-space indentation, no tabs
@@ -517,7 +947,7 @@ def get_language_fix_rules(file_ext: str) -> str:
 - snake_case for functions/variables, PascalCase for classes
 - Remove hardcoded passwords - use os.getenv() instead""",
 
-        'js': """- Use const/let instead of var
+    'js': """- Use const/let instead of var
 - Add JSDoc comments: /** @param {number} x @returns {number} */
 - Add semicolons at end of statements
 - Spaces around operators and after commas
@@ -525,7 +955,7 @@ def get_language_fix_rules(file_ext: str) -> str:
 - camelCase for functions/variables, PascalCase for classes
 - Consistent braces and indentation (2 spaces)""",
 
-        'ts': """- Add TypeScript types to ALL parameters: (x: number, y: number): number
+    'ts': """- Add TypeScript types to ALL parameters: (x: number, y: number): number
 - Add return types to all functions
 - Use const/let instead of var
 - Add JSDoc/TSDoc comments to all functions and classes
@@ -535,7 +965,7 @@ def get_language_fix_rules(file_ext: str) -> str:
 - Add interface definitions where appropriate
 - Semicolons at end of statements""",
 
-        'java': """- Add Javadoc to every class and method: /** description @param @return */
+    'java': """- Add Javadoc to every class and method: /** description @param @return */
 - Use proper access modifiers (private fields, public methods)
 - Use generics: ArrayList<Integer> not raw ArrayList
 - PascalCase for classes, camelCase for methods/variables
@@ -543,7 +973,7 @@ def get_language_fix_rules(file_ext: str) -> str:
 - Remove hardcoded passwords - use environment config
 - Add proper spacing around operators and after commas""",
 
-        'c': """- Add file header comment block
+    'c': """- Add file header comment block
 - Add function documentation comments
 - Add header guards if needed
 - Consistent indentation (4 spaces)
@@ -552,7 +982,7 @@ def get_language_fix_rules(file_ext: str) -> str:
 - Use const for constant values
 - snake_case for all identifiers""",
 
-        'cpp': """- Remove 'using namespace std;' - use std:: prefix instead
+    'cpp': """- Remove 'using namespace std;' - use std:: prefix instead
 - Add Doxygen comments to class and all methods
 - Add proper access modifiers
 - Spaces around operators and after commas
@@ -560,46 +990,64 @@ def get_language_fix_rules(file_ext: str) -> str:
 - Remove hardcoded passwords - use config constants
 - PascalCase for classes, camelCase for methods""",
 
-        'st': """- Add comment blocks using (* ... *) syntax NOT Python docstrings
+    'st': """- Add comment blocks using (* ... *) syntax NOT Python docstrings
 - Use proper IEC 61131-3 naming: prefix variables (b for BOOL, i for INT, s for STRING)
 - Add indentation inside IF/FOR/WHILE blocks (3 spaces)
 - Remove hardcoded passwords from VAR section
 - Add descriptive comments before each section
 - Use UPPERCASE for keywords: IF, THEN, END_IF, FOR, DO, END_FOR
 - Variable declarations should have inline comments"""
-    }
-    return rules.get(file_ext, "- Follow language best practices and add documentation")
+}
+
+
+def get_language_fix_rules(file_ext: str) -> str:
+    """Return language-specific fix rules for perfect score"""
+    return _LANG_FIX_RULES.get(file_ext, "- Follow language best practices and add documentation")
+
+
+# Display names for the fix prompt
+_LANG_NAMES: Dict[str, str] = {
+    'py': 'Python', 'js': 'JavaScript', 'ts': 'TypeScript',
+    'java': 'Java', 'c': 'C', 'cpp': 'C++', 'st': 'Structured Text (IEC 61131-3)',
+    'cs': 'C#'
+}
+
+# Structured Text keywords, matched as whole words on the raw code
+_ST_DETECT = re.compile(r'\b(?:VAR|END_VAR|PROGRAM|FUNCTION_BLOCK)\b', re.IGNORECASE)
 
 
 @app.route('/fix', methods=['POST'])
 def fix_code():
     """Fix code with Schneider rules context"""
     try:
-        data = request.json
+        data = read_json()
         if not data:
-            return jsonify({'error': 'No data'}), 400
+            return ojsonify({'error': 'No data'}), 400
             
         code = data.get('code', '')
         error = data.get('error', '')
         issues = data.get('issues', [])
+        filename = data.get('filename', '')
         
-        file_ext = 'st' if 'VAR' in code.upper() else 'py'
+        # Trust the filename's extension when it is a language we know; otherwise
+        # sniff the content. PureWindowsPath splits client paths on both / and \
+        file_ext = os.path.splitext(PureWindowsPath(str(filename)).name)[1][1:].lower()
+        if file_ext not in _LANG_NAMES and file_ext not in _LANG_FIX_RULES:
+            file_ext = 'st' if _ST_DETECT.search(code) else 'py'
         
         # Include relevant rules in fix prompt
-        relevant_rules = ""
-        if issues:
-            rule_ids = [i.get('rule', '') for i in issues if i.get('rule')]
-            for rule in ALL_RULES[:50]:  # Check first 50 rules
-                if rule.get('rule_id') in rule_ids:
-                    relevant_rules += f"[{rule['rule_id']}] {rule['rule']}\n  Fix: {rule['suggested_fix']}\n\n"
+        # dict.fromkeys de-duplicates while keeping issue order, so the prompt is stable.
+        # Rule ids are strings; anything else (e.g. a list) can't match and isn't hashable
+        rule_ids = dict.fromkeys(r for r in (i.get('rule') for i in issues) if r and isinstance(r, str))
+        relevant_rules = "".join(
+            f"[{rid}] {rule['rule']}\n  Fix: {rule['suggested_fix']}\n\n"
+            for rid in rule_ids
+            for rule in [_RULES_BY_ID.get(rid)] if rule
+        )
+        rules_block = f"\n\nSCHNEIDER RULES VIOLATED:\n{relevant_rules.rstrip()}" if relevant_rules else ""
         
         # Determine language name for prompt
-        lang_names = {
-            'py': 'Python', 'js': 'JavaScript', 'ts': 'TypeScript',
-            'java': 'Java', 'c': 'C', 'cpp': 'C++', 'st': 'Structured Text (IEC 61131-3)',
-            'cs': 'C#'
-        }
-        lang_name = lang_names.get(file_ext, file_ext.upper())
+        lang_name = _LANG_NAMES.get(file_ext, file_ext.upper())
 
         system_role = f"""You are an EXPERT {lang_name} code fixer for Schneider Electric.
 Your goal is to produce PERFECT {lang_name} code that scores 100/100.
@@ -619,7 +1067,7 @@ ORIGINAL {lang_name.upper()} CODE:
 {code}
 
 ISSUES TO FIX:
-{chr(10).join([f"- Line {i.get('line','?')}: {i.get('message','')} → {i.get('fix','')}" for i in issues]) if issues else error}
+{chr(10).join([f"- Line {i.get('line','?')}: {i.get('message','')} → {i.get('fix','')}" for i in issues]) if issues else error}{rules_block}
 
 CRITICAL: Return ONLY raw {lang_name} code. No backticks. No markdown. No explanations.
 The output must be directly saveable as a .{file_ext} file."""
@@ -630,23 +1078,23 @@ The output must be directly saveable as a .{file_ext} file."""
         if not fixed_code or len(fixed_code) < 5:
             fixed_code = code
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'fixed_code': fixed_code
         }), 200
     
     except Exception as e:
         logger.error(f"Fix error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """AI chat with Schneider rules context - gives ACTIONABLE fixes"""
     try:
-        data = request.json
+        data = read_json()
         if not data:
-            return jsonify({'error': 'No data'}), 400
+            return ojsonify({'error': 'No data'}), 400
             
         message = data.get('message', '')
         context = data.get('context', '')
@@ -674,255 +1122,125 @@ Be helpful, specific, and actionable!"""
         
         prompt = f"{context}\n\nUser Question: {message}\n\nProvide SPECIFIC fixes with code examples."
         
+        # Opt-in Server-Sent Events: the reply renders as it is generated
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            def events():
+                for text in stream_llm_response(prompt, system_role):
+                    yield f"data: {orjson.dumps({'delta': text}).decode()}\n\n"
+                yield "data: [DONE]\n\n"
+            return Response(stream_with_context(events()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
         reply = get_llm_response(prompt, system_role)
         
-        return jsonify({'success': True, 'reply': reply}), 200
+        return ojsonify({'success': True, 'reply': reply}), 200
     
     except Exception as e:
         logger.error(f"Chat error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
+
+
+# PDF rendering is CPU-bound, so reports are built in worker processes and the
+# request thread returns at once; /download_report waits for the job to finish.
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', str(min(4, os.cpu_count() or 1))))
+REPORT_WAIT_SECONDS = 15
+# Failed jobs are kept this long so a download can report the error
+REPORT_FAILED_TTL = 600
+# A .pending marker older than this belongs to a build that died (killed
+# pool process, server restart) and is treated as stale
+REPORT_PENDING_MAX_AGE = 300
+# Never fork a threaded server process: forkserver/spawn children start clean
+_REPORT_MP_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+_REPORT_POOL: Optional[ProcessPoolExecutor] = None
+# filename -> (job, time.monotonic() when queued); guarded by _REPORT_LOCK
+_REPORT_JOBS: Dict[str, Tuple[Future, float]] = {}
+_REPORT_LOCK = threading.Lock()
+
+
+def _report_submit(fn, *args) -> Future:
+    """Run fn on the report process pool, (re)creating the pool as needed"""
+    global _REPORT_POOL
+    with _REPORT_LOCK:
+        # Created on first use, so a preloading server forks before any pool exists
+        if _REPORT_POOL is None:
+            _REPORT_POOL = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=_REPORT_MP_CONTEXT)
+        try:
+            return _REPORT_POOL.submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning("⚠️  Report pool was broken, restarting it")
+            _REPORT_POOL = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=_REPORT_MP_CONTEXT)
+            return _REPORT_POOL.submit(fn, *args)
+
+
+def submit_report(report_filename: str, report_path: str, payload: Dict) -> None:
+    """Queue a PDF build on the report process pool"""
+    # Finished jobs are on disk now; failed ones stay until their download
+    # reports the error, or until they are REPORT_FAILED_TTL old
+    now = time.monotonic()
+    with _REPORT_LOCK:
+        for name, (job, queued_at) in list(_REPORT_JOBS.items()):
+            if job.done() and (now - queued_at > REPORT_FAILED_TTL
+                               or not job.cancelled() and job.exception() is None):
+                del _REPORT_JOBS[name]
+    
+    # Marker for downloads that land on a different server worker than this one
+    open(report_path + '.pending', 'wb').close()
+    try:
+        job = _report_submit(build_pdf, report_path, payload)
+    except Exception:
+        clear_report_markers(report_path)
+        raise
+    
+    def _on_done(done: Future) -> None:
+        # A worker process that dies can't clean up after itself, so the parent does
+        if done.cancelled() or done.exception():
+            clear_report_markers(report_path)
+        else:
+            logger.info(f"✅ Report generated: {report_filename}")
+    
+    job.add_done_callback(_on_done)
+    with _REPORT_LOCK:
+        _REPORT_JOBS[report_filename] = (job, now)
 
 
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
     """Generate ENHANCED PDF report with Schneider branding"""
     try:
-        data = request.json
+        data = read_json()
         if not data:
-            return jsonify({'error': 'No data'}), 400
+            return ojsonify({'error': 'No data'}), 400
             
-        issues = data.get('issues', [])
-        score = data.get('score', 0)
         filename = data.get('filename', 'analysis')
-        code = data.get('code', '')
-        grade = data.get('grade', 'N/A')
+        payload = {
+            'issues': data.get('issues', []),
+            'score': data.get('score', 0),
+            'filename': filename,
+            'grade': data.get('grade', 'N/A'),
+            'line_count': count_lines(data.get('code', '')),
+            'rules_checked': len(ALL_RULES),
+            'engine': f"{LLM_PROVIDER.upper()} ({OPENAI_MODEL if LLM_PROVIDER == 'openai' else GEMINI_MODEL})"
+        }
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         report_filename = f"Schneider_Audit_{filename.replace('.', '_')}_{timestamp}.pdf"
         report_path = os.path.join(REPORTS_DIR, report_filename)
         
-        doc = SimpleDocTemplate(report_path, pagesize=A4)
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=28,
-            textColor=colors.HexColor('#3DCD58'),
-            alignment=TA_CENTER,
-            spaceAfter=20
-        )
-        
-        story.append(Paragraph("⚡ SCHNEIDER ELECTRIC", title_style))
-        story.append(Paragraph("EcoStruxure™ AI Code Audit Report", styles['Heading2']))
-        story.append(Spacer(1, 0.5*inch))
+        # ?inline=1 returns the PDF in this response instead of a download link
+        if request.args.get('inline', '').lower() in ('1', 'true'):
+            pdf = _report_submit(render_pdf_bytes, payload).result()
+            logger.info(f"✅ Report generated inline: {report_filename}")
+            return send_file(io.BytesIO(pdf), mimetype='application/pdf',
+                             as_attachment=True, download_name=report_filename)
         
-        # Executive Summary
-        summary_style = ParagraphStyle(
-            'Summary',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#333333')
-        )
+        submit_report(report_filename, report_path, payload)
+        logger.info(f"📄 Report queued: {report_filename}")
         
-        summary_text = f"""
-        This automated audit was conducted using Schneider Electric's AI-powered code 
-        review system, analyzing {len(ALL_RULES)} organizational coding standards 
-        including IEC 61131-3 compliance, energy efficiency guidelines, and security protocols.
-        """
-        story.append(Paragraph(summary_text, summary_style))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Metadata table
-        metadata = [
-            ['Report Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-            ['File Analyzed:', filename],
-            ['Lines of Code:', str(len(code.split('\n')))],
-            ['Quality Score:', f"{score}/100 ({grade})"],
-            ['Issues Found:', str(len(issues))],
-            ['Rules Checked:', str(len(ALL_RULES))],
-            ['Analysis Engine:', f"{LLM_PROVIDER.upper()} ({OPENAI_MODEL if LLM_PROVIDER == 'openai' else GEMINI_MODEL})"]
-        ]
-        
-        meta_table = Table(metadata, colWidths=[2.5*inch, 3.5*inch])
-        meta_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (0,-1), colors.HexColor('#F0F0F0')),
-            ('TEXTCOLOR', (0,0), (-1,-1), colors.black),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,-1), 10),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ]))
-        story.append(meta_table)
-        story.append(Spacer(1, 0.4*inch))
-        
-        # Compliance Status
-        if score >= 90:
-            status = "EXCELLENT - FULLY COMPLIANT ✓"
-            status_color = colors.HexColor('#00A651')
-        elif score >= 80:
-            status = "GOOD - COMPLIANT ✓"
-            status_color = colors.HexColor('#3DCD58')
-        elif score >= 60:
-            status = "ACCEPTABLE - NEEDS IMPROVEMENT"
-            status_color = colors.HexColor('#FF8C00')
-        else:
-            status = "NON-COMPLIANT - ACTION REQUIRED"
-            status_color = colors.HexColor('#DC143C')
-        
-        status_data = [
-            ['Compliance Status:', status],
-            ['Quality Grade:', grade],
-            ['Overall Score:', f"{score}/100"]
-        ]
-        
-        status_table = Table(status_data, colWidths=[2.5*inch, 3.5*inch])
-        status_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#FAFAFA')),
-            ('TEXTCOLOR', (1,0), (1,0), status_color),
-            ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
-            ('FONTNAME', (1,0), (1,-1), 'Helvetica-Bold'),
-            ('FONTSIZE', (1,0), (1,0), 14),
-            ('FONTSIZE', (0,0), (-1,-1), 11),
-            ('GRID', (0,0), (-1,-1), 1, colors.grey),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('TOPPADDING', (0,0), (-1,-1), 12),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 12),
-        ]))
-        story.append(status_table)
-        story.append(Spacer(1, 0.4*inch))
-        
-        # Issue Statistics
-        if issues:
-            stats = {
-                'Critical': sum(1 for i in issues if i.get('severity') == 'critical'),
-                'Errors': sum(1 for i in issues if i.get('severity') == 'error'),
-                'Warnings': sum(1 for i in issues if i.get('severity') == 'warning'),
-                'Info': sum(1 for i in issues if i.get('severity') == 'info')
-            }
-            
-            story.append(Paragraph("Issue Breakdown", styles['Heading3']))
-            stats_data = [['Severity', 'Count', 'Impact']]
-            
-            for sev, count in stats.items():
-                if count > 0:
-                    if sev == 'Critical':
-                        impact = 'High Risk'
-                    elif sev == 'Errors':
-                        impact = 'Medium Risk'
-                    elif sev == 'Warnings':
-                        impact = 'Low Risk'
-                    else:
-                        impact = 'Informational'
-                    stats_data.append([sev, str(count), impact])
-            
-            stats_table = Table(stats_data, colWidths=[2*inch, 1.5*inch, 2.5*inch])
-            stats_table.setStyle(TableStyle([
-                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#3DCD58')),
-                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0,0), (-1,0), 11),
-                ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#F5F5F5')]),
-                ('ALIGN', (1,1), (1,-1), 'CENTER'),
-            ]))
-            story.append(stats_table)
-            story.append(Spacer(1, 0.4*inch))
-            
-            # Detailed Issues
-            story.append(Paragraph("Detailed Findings", styles['Heading3']))
-            story.append(Spacer(1, 0.2*inch))
-            
-            issues_data = [['#', 'Rule', 'Severity', 'Message', 'Line']]
-            
-            for idx, issue in enumerate(issues, 1):
-                issues_data.append([
-                    str(idx),
-                    str(issue.get('rule', 'N/A'))[:12],
-                    str(issue.get('severity', 'info')).title(),
-                    str(issue.get('message', ''))[:60],
-                    str(issue.get('line', '-'))
-                ])
-            
-            issues_table = Table(issues_data, colWidths=[0.4*inch, 0.8*inch, 0.8*inch, 3.5*inch, 0.5*inch])
-            issues_table.setStyle(TableStyle([
-                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#3DCD58')),
-                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0,0), (-1,-1), 9),
-                ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#F9F9F9')]),
-                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                ('ALIGN', (0,1), (0,-1), 'CENTER'),
-                ('ALIGN', (4,1), (4,-1), 'CENTER'),
-            ]))
-            story.append(issues_table)
-        else:
-            story.append(Paragraph("✓ Excellent! No issues found.", styles['Normal']))
-            story.append(Paragraph("Code fully complies with all Schneider Electric standards.", styles['Normal']))
-        
-        story.append(PageBreak())
-        
-        # Recommendations
-        story.append(Paragraph("Recommendations & Next Steps", styles['Heading3']))
-        story.append(Spacer(1, 0.2*inch))
-        
-        if score >= 90:
-            recs = [
-                "• Continue maintaining high code quality standards",
-                "• Consider peer code reviews for knowledge sharing",
-                "• Document best practices for team reference"
-            ]
-        elif score >= 70:
-            recs = [
-                "• Address all critical and high-priority issues",
-                "• Review Schneider coding guidelines documentation",
-                "• Schedule follow-up audit after corrections"
-            ]
-        else:
-            recs = [
-                "• URGENT: Fix all critical security and compliance issues",
-                "• Request technical review with senior developer",
-                "• Attend Schneider coding standards training",
-                "• Re-audit after major corrections"
-            ]
-        
-        for rec in recs:
-            story.append(Paragraph(rec, styles['Normal']))
-            story.append(Spacer(1, 0.1*inch))
-        
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Footer
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.grey,
-            alignment=TA_CENTER
-        )
-        story.append(Spacer(1, 0.5*inch))
-        story.append(Paragraph("━" * 80, footer_style))
-        story.append(Paragraph(
-            "This report is generated by Schneider Electric AI Code Reviewer v8.0",
-            footer_style
-        ))
-        story.append(Paragraph(
-            "For questions or support, contact your Schneider Electric technical lead",
-            footer_style
-        ))
-        
-        # Build PDF
-        doc.build(story)
-        
-        logger.info(f"✅ Report generated: {report_filename}")
-        
-        return jsonify({
+        return ojsonify({
             'success': True,
+            'status': 'queued',
             'filename': report_filename,
             'path': report_path,
             'download_url': f'/download_report/{report_filename}'
@@ -930,20 +1248,79 @@ def generate_report():
     
     except Exception as e:
         logger.error(f"Report generation error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
+
+
+def _pending_age(marker: Path) -> Optional[float]:
+    """Seconds since a .pending marker was written, or None if there is none"""
+    try:
+        return time.time() - marker.stat().st_mtime
+    except FileNotFoundError:
+        return None
 
 
 @app.route('/download_report/<filename>', methods=['GET'])
 def download_report(filename):
-    """Download report"""
+    """Download report, waiting briefly if it is still being built"""
     try:
-        file_path = os.path.join(REPORTS_DIR, filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True, download_name=filename)
-        return jsonify({'error': 'Report not found'}), 404
+        with _REPORT_LOCK:
+            job, _ = _REPORT_JOBS.get(filename, (None, 0.0))
+        if job is not None:
+            try:
+                job.result(timeout=REPORT_WAIT_SECONDS)
+            except FuturesTimeoutError:
+                return ojsonify({'status': 'pending', 'filename': filename}), 202, {'Retry-After': '2'}
+            except Exception as e:
+                with _REPORT_LOCK:
+                    _REPORT_JOBS.pop(filename, None)
+                logger.error(f"Report generation error: {e}")
+                return ojsonify({'error': str(e)}), 500
+        
+        file_path = Path(REPORTS_DIR) / filename
+        # Only serve files that really live in the reports directory
+        if not file_path.resolve().is_relative_to(_REPORTS_ROOT):
+            return ojsonify({'error': 'Report not found'}), 404
+        
+        pending_marker = file_path.with_name(filename + '.pending')
+        pending_age = _pending_age(pending_marker) if job is None else None
+        if pending_age is not None and pending_age > REPORT_PENDING_MAX_AGE:
+            clear_report_markers(str(file_path))
+            logger.error(f"Report generation did not finish: {filename}")
+            return ojsonify({'error': 'Report generation did not finish'}), 500
+        if pending_age is not None:
+            # Queued by another server worker - wait for its marker to clear
+            deadline = time.monotonic() + REPORT_WAIT_SECONDS
+            while pending_marker.exists() and time.monotonic() < deadline:
+                time.sleep(0.25)
+            if pending_marker.exists():
+                return ojsonify({'status': 'pending', 'filename': filename}), 202, {'Retry-After': '2'}
+        
+        if file_path.is_file():
+            return send_file(file_path, as_attachment=True, download_name=filename,
+                             conditional=True, etag=True, max_age=0)
+        return ojsonify({'error': 'Report not found'}), 404
     except Exception as e:
         logger.error(f"Download error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
+
+
+# /rules bodies serialized once - the rules and categories never change after startup
+_RULES_JSON: Dict[str, bytes] = {
+    'all': orjson.dumps({
+        'success': True,
+        'rules': ALL_RULES,
+        'total': len(ALL_RULES)
+    }),
+    **{
+        category: orjson.dumps({
+            'success': True,
+            'rules': rules,
+            'total': len(rules),
+            'category': category
+        })
+        for category, rules in RULE_CATEGORIES.items()
+    }
+}
 
 
 @app.route('/rules', methods=['GET'])
@@ -952,55 +1329,46 @@ def get_rules():
     try:
         category = request.args.get('category', 'all')
         
-        if category == 'all':
-            return jsonify({
-                'success': True,
-                'rules': ALL_RULES,
-                'total': len(ALL_RULES)
-            }), 200
-        elif category in RULE_CATEGORIES:
-            return jsonify({
-                'success': True,
-                'rules': RULE_CATEGORIES[category],
-                'total': len(RULE_CATEGORIES[category]),
-                'category': category
-            }), 200
-        else:
-            return jsonify({'error': 'Invalid category'}), 400
+        body = _RULES_JSON.get(category)
+        if body is None:
+            return ojsonify({'error': 'Invalid category'}), 400
+        return app.response_class(body, mimetype='application/json'), 200
             
     except Exception as e:
         logger.error(f"Rules fetch error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
+
+
+# /statistics never changes after startup - build and serialize it once
+_STATS_PAYLOAD = {
+    'success': True,
+    'statistics': {
+        'total_rules': len(ALL_RULES),
+        'rule_categories': {k: len(v) for k, v in RULE_CATEGORIES.items()},
+        'llm_provider': LLM_PROVIDER,
+        'model': OPENAI_MODEL if LLM_PROVIDER == 'openai' else GEMINI_MODEL,
+        'version': '8.0',
+        'features': [
+            'Schneider Rules Integration',
+            'Fair Scoring System',
+            'PDF Report Generation',
+            'Auto-Fix Capability',
+            'AI Chat Assistant',
+            'Rule Categorization'
+        ]
+    }
+}
+_STATS_JSON = orjson.dumps(_STATS_PAYLOAD)
 
 
 @app.route('/statistics', methods=['GET'])
 def get_statistics():
     """Get system statistics"""
-    try:
-        return jsonify({
-            'success': True,
-            'statistics': {
-                'total_rules': len(ALL_RULES),
-                'rule_categories': {k: len(v) for k, v in RULE_CATEGORIES.items()},
-                'llm_provider': LLM_PROVIDER,
-                'model': OPENAI_MODEL if LLM_PROVIDER == 'openai' else GEMINI_MODEL,
-                'version': '8.0',
-                'features': [
-                    'Schneider Rules Integration',
-                    'Fair Scoring System',
-                    'PDF Report Generation',
-                    'Auto-Fix Capability',
-                    'AI Chat Assistant',
-                    'Rule Categorization'
-                ]
-            }
-        }), 200
-    except Exception as e:
-        logger.error(f"Statistics error: {e}")
-        return jsonify({'error': str(e)}), 500
+    return app.response_class(_STATS_JSON, mimetype='application/json'), 200
 
 
 if __name__ == '__main__':
+    port = int(os.getenv('FLASK_PORT', '5000'))
     print("=" * 80)
     print("🏆 SCHNEIDER ELECTRIC AI CODE REVIEWER - PRODUCTION v8.0")
     print("=" * 80)
@@ -1014,7 +1382,18 @@ if __name__ == '__main__':
     print(f"   📋 General: {len(RULE_CATEGORIES['general'])}")
     print(f"✅ Scoring: Fair & Balanced System")
     print(f"✅ Reports: Enhanced PDF Generation")
-    print("🚀 Server: http://localhost:5000")
+    print(f"🚀 Server: http://localhost:{port}")
     print("=" * 80)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # waitress is a production WSGI server that also runs on Windows;
+    # on Linux, gunicorn (see gunicorn.conf.py) adds multiple worker processes
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+        print("⚠️  waitress not available - using Flask's development server (pip install waitress)")
+    
+    if serve:
+        serve(app, host='0.0.0.0', port=port, threads=int(os.getenv('WAITRESS_THREADS', '32')))
+    else:
+        app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=port, threaded=True)
\ No newline at end of file
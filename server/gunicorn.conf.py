@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for the Schneider Electric AI Code Reviewer.
+
+Run from the server/ directory (rules are loaded relative to it):
+    gunicorn app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', '5000')}"
+
+# Handlers spend nearly all their time waiting on OpenAI/Gemini HTTP calls.
+# Threads release the GIL on socket I/O, so each worker overlaps many LLM calls;
+# several worker processes keep one busy interpreter from stalling the rest.
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import the app (and parse the rules file) once in the master before forking,
+# so workers share those pages copy-on-write instead of each re-parsing them
+preload_app = True
+
+# LLM calls can take up to the 60s client timeout plus retries
+timeout = 180
@@ -0,0 +1,327 @@
+"""
+PDF audit report rendering for the Schneider Electric AI Code Reviewer.
+
+Report jobs run in worker processes, which import only this module - not
+the Flask app with its rules and LLM clients.
+"""
+
+import io
+import os
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import BinaryIO, Dict, Union
+
+
+@lru_cache(maxsize=1)
+def _report_styles() -> Dict:
+    """Build the report's paragraph and table styles once, on first use"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    from reportlab.lib.enums import TA_CENTER
+    
+    styles = getSampleStyleSheet()
+    return {
+        'sheet': styles,
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=28,
+            textColor=colors.HexColor('#3DCD58'),
+            alignment=TA_CENTER,
+            spaceAfter=20
+        ),
+        'summary': ParagraphStyle(
+            'Summary',
+            parent=styles['Normal'],
+            fontSize=11,
+            textColor=colors.HexColor('#333333')
+        ),
+        # Normal text with a 0.1in gap under each line (12pt leading + 7.2pt)
+        'recommendations': ParagraphStyle(
+            'Recommendations',
+            parent=styles['Normal'],
+            leading=19.2
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.grey,
+            alignment=TA_CENTER
+        ),
+        'meta_table': TableStyle([
+            ('BACKGROUND', (0,0), (0,-1), colors.HexColor('#F0F0F0')),
+            ('TEXTCOLOR', (0,0), (-1,-1), colors.black),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,-1), 10),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ]),
+        # The status cell's text colour depends on the score and is applied per report
+        'status_table': TableStyle([
+            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#FAFAFA')),
+            ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
+            ('FONTNAME', (1,0), (1,-1), 'Helvetica-Bold'),
+            ('FONTSIZE', (1,0), (1,0), 14),
+            ('FONTSIZE', (0,0), (-1,-1), 11),
+            ('GRID', (0,0), (-1,-1), 1, colors.grey),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+            ('TOPPADDING', (0,0), (-1,-1), 12),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 12),
+        ]),
+        'stats_table': TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#3DCD58')),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,0), 11),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+        ]),
+        'stats_row_colors': [colors.white, colors.HexColor('#F5F5F5')],
+        'issues_table': TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#3DCD58')),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,-1), 9),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#F9F9F9')]),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+            ('ALIGN', (0,1), (0,-1), 'CENTER'),
+            ('ALIGN', (4,1), (4,-1), 'CENTER'),
+        ]),
+    }
+
+
+# Risk label shown next to each severity in the Issue Breakdown table
+IMPACT_MAP = {
+    'Critical': 'High Risk',
+    'Errors': 'Medium Risk',
+    'Warnings': 'Low Risk',
+    'Info': 'Informational'
+}
+
+
+# Recommendation bullets by score band: below 70, 70-89, 90 and up
+LOW_RECS = (
+    "• URGENT: Fix all critical security and compliance issues",
+    "• Request technical review with senior developer",
+    "• Attend Schneider coding standards training",
+    "• Re-audit after major corrections"
+)
+MID_RECS = (
+    "• Address all critical and high-priority issues",
+    "• Review Schneider coding guidelines documentation",
+    "• Schedule follow-up audit after corrections"
+)
+HIGH_RECS = (
+    "• Continue maintaining high code quality standards",
+    "• Consider peer code reviews for knowledge sharing",
+    "• Document best practices for team reference"
+)
+_RECS_THRESHOLDS = (70, 90)
+_RECS = (LOW_RECS, MID_RECS, HIGH_RECS)
+
+# Rows per Detailed Findings table (an even count keeps the row shading in step)
+ISSUES_TABLE_CHUNK = 50
+
+
+def clear_report_markers(report_path: str) -> None:
+    """Remove a report's .pending marker and any half-written .part file"""
+    for suffix in ('.pending', '.part'):
+        try:
+            os.remove(report_path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def build_pdf(report_path: str, payload: Dict) -> None:
+    """Build one queued report - runs in a report worker process"""
+    # Restamp the marker: its age now counts from when the build started, not
+    # from when it was queued, so a long queue never looks like a dead build
+    try:
+        os.utime(report_path + '.pending')
+    except FileNotFoundError:
+        pass
+    try:
+        # Rendered under a temporary name and renamed, so a download never sees a partial file
+        render_pdf(report_path + '.part', payload)
+        os.replace(report_path + '.part', report_path)
+    finally:
+        # Tells /download_report in other server processes the job is over
+        clear_report_markers(report_path)
+
+
+def render_pdf_bytes(payload: Dict) -> bytes:
+    """Render a report in memory - for ?inline=1 responses, skips the disk entirely"""
+    buf = io.BytesIO()
+    render_pdf(buf, payload)
+    return buf.getvalue()
+
+
+def render_pdf(report_path: Union[str, BinaryIO], payload: Dict) -> None:
+    """Render the audit report PDF to a file path or binary stream"""
+    # ReportLab is only needed here - import on first use to keep worker startup light
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer, PageBreak, HRFlowable
+    
+    issues = payload['issues']
+    score = payload['score']
+    filename = payload['filename']
+    grade = payload['grade']
+    line_count = payload['line_count']
+    rules_checked = payload['rules_checked']
+    engine = payload['engine']
+    
+    doc = SimpleDocTemplate(report_path, pagesize=A4)
+    story = []
+    report_styles = _report_styles()
+    styles = report_styles['sheet']
+    
+    # Title
+    story.append(Paragraph("⚡ SCHNEIDER ELECTRIC", report_styles['title']))
+    story.append(Paragraph("EcoStruxure™ AI Code Audit Report", styles['Heading2']))
+    story.append(Spacer(1, 0.5*inch))
+    
+    # Executive Summary
+    summary_text = f"""
+    This automated audit was conducted using Schneider Electric's AI-powered code 
+    review system, analyzing {rules_checked} organizational coding standards 
+    including IEC 61131-3 compliance, energy efficiency guidelines, and security protocols.
+    """
+    story.append(Paragraph(summary_text, report_styles['summary']))
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Metadata table
+    metadata = [
+        ['Report Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
+        ['File Analyzed:', filename],
+        ['Lines of Code:', str(line_count)],
+        ['Quality Score:', f"{score}/100 ({grade})"],
+        ['Issues Found:', str(len(issues))],
+        ['Rules Checked:', str(rules_checked)],
+        ['Analysis Engine:', engine]
+    ]
+    
+    meta_table = Table(metadata, colWidths=[2.5*inch, 3.5*inch])
+    meta_table.setStyle(report_styles['meta_table'])
+    story.append(meta_table)
+    story.append(Spacer(1, 0.4*inch))
+    
+    # Compliance Status
+    if score >= 90:
+        status = "EXCELLENT - FULLY COMPLIANT ✓"
+        status_color = colors.HexColor('#00A651')
+    elif score >= 80:
+        status = "GOOD - COMPLIANT ✓"
+        status_color = colors.HexColor('#3DCD58')
+    elif score >= 60:
+        status = "ACCEPTABLE - NEEDS IMPROVEMENT"
+        status_color = colors.HexColor('#FF8C00')
+    else:
+        status = "NON-COMPLIANT - ACTION REQUIRED"
+        status_color = colors.HexColor('#DC143C')
+    
+    status_data = [
+        ['Compliance Status:', status],
+        ['Quality Grade:', grade],
+        ['Overall Score:', f"{score}/100"]
+    ]
+    
+    status_table = Table(status_data, colWidths=[2.5*inch, 3.5*inch])
+    status_table.setStyle(report_styles['status_table'])
+    status_table.setStyle([('TEXTCOLOR', (1,0), (1,0), status_color)])
+    story.append(status_table)
+    story.append(Spacer(1, 0.4*inch))
+    
+    # Issue Statistics
+    if issues:
+        # One pass over the issues; a missing severity counts as info, as in the table below
+        sev_counts = Counter(str(i.get('severity', 'info')) for i in issues)
+        stats = {
+            'Critical': sev_counts['critical'],
+            'Errors': sev_counts['error'],
+            'Warnings': sev_counts['warning'],
+            'Info': sev_counts['info']
+        }
+        
+        story.append(Paragraph("Issue Breakdown", styles['Heading3']))
+        stats_data = [['Severity', 'Count', 'Impact']]
+        
+        for sev, count in stats.items():
+            if count > 0:
+                stats_data.append([sev, str(count), IMPACT_MAP[sev]])
+        
+        stats_table = Table(stats_data, colWidths=[2*inch, 1.5*inch, 2.5*inch])
+        stats_table.setStyle(report_styles['stats_table'])
+        nrows = len(stats_data) - 1
+        if nrows > 0:
+            # Body commands only cover the severity rows actually present
+            stats_table.setStyle([
+                ('ROWBACKGROUNDS', (0,1), (-1,nrows), report_styles['stats_row_colors']),
+                ('ALIGN', (1,1), (1,nrows), 'CENTER'),
+            ])
+        story.append(stats_table)
+        story.append(Spacer(1, 0.4*inch))
+        
+        # Detailed Issues
+        story.append(Paragraph("Detailed Findings", styles['Heading3']))
+        story.append(Spacer(1, 0.2*inch))
+        
+        header = ['#', 'Rule', 'Severity', 'Message', 'Line']
+        issues_data = [
+            [
+                str(idx),
+                str(issue.get('rule', 'N/A'))[:12],
+                str(issue.get('severity', 'info')).title(),
+                str(issue.get('message', ''))[:60],
+                str(issue.get('line', '-'))
+            ]
+            for idx, issue in enumerate(issues, 1)
+        ]
+        
+        # Several short tables instead of one long one - ReportLab's table
+        # splitting gets slow as row counts grow
+        for start in range(0, len(issues_data), ISSUES_TABLE_CHUNK):
+            issues_table = Table([header] + issues_data[start:start + ISSUES_TABLE_CHUNK],
+                                 colWidths=[0.4*inch, 0.8*inch, 0.8*inch, 3.5*inch, 0.5*inch],
+                                 repeatRows=1, splitByRow=1)
+            issues_table.setStyle(report_styles['issues_table'])
+            story.append(issues_table)
+            story.append(Spacer(1, 0.1*inch))
+    else:
+        story.append(Paragraph("✓ Excellent! No issues found.", styles['Normal']))
+        story.append(Paragraph("Code fully complies with all Schneider Electric standards.", styles['Normal']))
+    
+    story.append(PageBreak())
+    
+    # Recommendations
+    story.append(Paragraph("Recommendations & Next Steps", styles['Heading3']))
+    story.append(Spacer(1, 0.2*inch))
+    
+    recs = _RECS[bisect_right(_RECS_THRESHOLDS, score)]
+    
+    # One flowable for all bullets; the style's leading keeps the old per-bullet gap
+    story.append(Paragraph("<br/>".join(recs), report_styles['recommendations']))
+    story.append(Spacer(1, 0.4*inch))
+    
+    # Footer
+    footer_style = report_styles['footer']
+    story.append(Spacer(1, 0.5*inch))
+    story.append(HRFlowable(width="100%", thickness=0.5, color=colors.grey, spaceBefore=4, spaceAfter=4))
+    story.append(Paragraph(
+        "This report is generated by Schneider Electric AI Code Reviewer v8.0",
+        footer_style
+    ))
+    story.append(Paragraph(
+        "For questions or support, contact your Schneider Electric technical lead",
+        footer_style
+    ))
+    
+    # Build PDF
+    doc.build(story)
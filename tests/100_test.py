@@ -3,6 +3,8 @@ Perfect Python code example for testing 100/100 score.
 This should pass all checks.
 """
 
+from typing import Sequence
+
 
 def calculate_power(voltage: float, current: float) -> float:
     """
@@ -74,6 +76,20 @@ class EnergyMonitor:
             raise ValueError("Energy must be positive")
         self.total_energy += energy
 
+    def record_consumption_batch(self, energies: Sequence[float]) -> None:
+        """
+        Record many energy readings in one call.
+
+        Args:
+            energies: Energy readings in watt-hours
+
+        Raises:
+            ValueError: If any reading is negative
+        """
+        if any(e < 0 for e in energies):
+            raise ValueError("Energy must be positive")
+        self.total_energy += sum(energies)
+
 
 if __name__ == "__main__":
     # Example usage